@@ -1,10 +1,14 @@
 # Convert edf data to BornAgain histogram
 
+import os
+import sys
 from matplotlib import pyplot as plt
 from matplotlib import colors
-import fabio
 import bornagain as ba
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulation"))
+from core.edf_reader import read_edf
+
 DISTANCE = 909.99  # mm
 PIX_SIZE = 4*41.74e-6  # m
 CENTER_X = 108.2
@@ -14,17 +18,17 @@ CENTER_Y = 942.0
 # 001_150_P109_im_full.edf - Fig 4.19 on page 65 of Elisabeth's PhD
 
 def convert(filename):
-    img = fabio.open(filename)
-    print(img.header)
+    img_data, header = read_edf(filename)
+    print(header)
 
-    data = img.data.astype("float64")
+    data = img_data.astype("float64")
 
     nx, ny = 1024, 1024
     hist = ba.Histogram2D(nx, 0.0, nx*PIX_SIZE*1000., ny, 0.0, ny*PIX_SIZE*1000.)
     hist.setContent(data)
 
     plt.figure()
-    plt.imshow(img.data, norm=colors.LogNorm(100, 1e+07))
+    plt.imshow(img_data, norm=colors.LogNorm(100, 1e+07))
 
     plt.figure()
     ba.plot_histogram(hist)
@@ -0,0 +1,50 @@
+"""
+Checks that folding of mesocrystal orientations into the irreducible wedge of crystal
+rotational symmetry (RotatedMesoFactory, "fold_symmetry") doesn't change the result.
+"""
+import argparse
+import copy
+import time
+from core.simulation_builder import SimulationBuilder
+from core.create_mesocrystal_builder import create_mesocrystal_builder
+from core.meso_utils import load_setup
+from core.metrics import relative_l2, roi_mask
+
+
+def simulate(exp_config, sample_config, fold_symmetry):
+    cfg = copy.deepcopy(sample_config)
+    cfg["RotatedMesoFactory"]["fold_symmetry"] = fold_symmetry
+    builder = SimulationBuilder(exp_config, cfg)
+    start = time.time()
+    result = builder.run_simulation()
+    return result.array(), time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--phi-steps", type=int, default=None, help="override number of phi steps")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="allowed relative L2 difference")
+    args = parser.parse_args()
+
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", "rotmeso")
+    if args.phi_steps:
+        sample_config["RotatedMesoFactory"]["phi_steps"] = args.phi_steps
+
+    phi_period = create_mesocrystal_builder(sample_config, None).phi_period()
+    print("Crystal phi period: {:.1f} deg".format(phi_period))
+
+    unfolded, time_unfolded = simulate(exp_config, sample_config, False)
+    folded, time_folded = simulate(exp_config, sample_config, True)
+
+    diff = relative_l2(folded, unfolded, roi_mask(unfolded))
+    print("Unfolded: {:.1f} sec, folded: {:.1f} sec, speedup {:.2f}".format(
+        time_unfolded, time_folded, time_unfolded/time_folded))
+    print("Relative L2 difference: {:.3e} (tolerance {:.1e})".format(diff, args.tolerance))
+    if diff > args.tolerance:
+        raise RuntimeError("Folded result differs from unfolded one")
+    print("Terminated successfully")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""
+Converts all EDF files in data directory into cached float32 .npy arrays.
+"""
+import argparse
+from core.experimental_data import convert_all
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pattern", default="*.edf.gz", help="file name pattern in data directory")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    for filename in convert_all(args.pattern, args.workers):
+        print("'{}'".format(filename))
+    print("Terminated successfully")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Analytic prediction of Bragg peak positions on the detector.
+Reciprocal lattice of the hexagonal lattice with SimpleSelectionRule(-1, 1, 1, 3) is rotated
+as the mesocrystal (RotationZ, then RotationX), exit angles are corrected for refraction
+in the layer (DWBA) and scattered wave vectors are projected on the detector plane.
+All calculations are vectorized over the batch of lattice and orientation parameters.
+"""
+import numpy as np
+from .detector_builder import DetectorBuilder
+
+
+def miller_indices(max_index=6, selection_rule=(-1, 1, 1, 3)):
+    """
+    Returns array (n, 3) of non-zero (h, k, l) with |h|, |k|, |l| <= max_index allowed by
+    the selection rule (a*h + b*k + c*l) % modulus == 0.
+    """
+    values = np.arange(-max_index, max_index+1)
+    hkl = np.stack(np.meshgrid(values, values, values, indexing="ij"), axis=-1).reshape(-1, 3)
+    a, b, c, modulus = selection_rule
+    allowed = (a*hkl[:, 0] + b*hkl[:, 1] + c*hkl[:, 2]) % modulus == 0
+    allowed &= np.any(hkl != 0, axis=1)
+    return hkl[allowed]
+
+
+def reciprocal_vectors(length_a, length_c, hkl):
+    """
+    Returns reciprocal lattice vectors (batch, n, 3) in 1/nm of ba.Lattice.createHexagonalLattice(a, c),
+    i.e. a1 = (a, 0, 0), a2 = (-a/2, a*sqrt(3)/2, 0), a3 = (0, 0, c), for every lattice of the batch.
+    """
+    length_a = np.atleast_1d(np.asarray(length_a, dtype=float))[:, np.newaxis]
+    length_c = np.atleast_1d(np.asarray(length_c, dtype=float))[:, np.newaxis]
+    h, k, l = hkl[:, 0], hkl[:, 1], hkl[:, 2]
+    b1 = 2.0*np.pi/length_a
+    b2 = 4.0*np.pi/(np.sqrt(3.0)*length_a)
+    gx = b1*h
+    gy = b1*h/np.sqrt(3.0) + b2*k
+    gz = 2.0*np.pi/length_c*l
+    return np.stack(np.broadcast_arrays(gx, gy, gz), axis=-1)
+
+
+def rotation_matrices(rotation_z, rotation_x):
+    """
+    Returns rotation matrices (batch, 3, 3) RotationX*RotationZ (angles in degrees), same order
+    as in MesoCrystalBuilder.create_meso_instance.
+    """
+    phi = np.radians(np.atleast_1d(np.asarray(rotation_z, dtype=float)))
+    tilt = np.radians(np.atleast_1d(np.asarray(rotation_x, dtype=float)))
+    zeros, ones = np.zeros_like(phi), np.ones_like(phi)
+    rot_z = np.stack([np.stack([np.cos(phi), -np.sin(phi), zeros], -1),
+                      np.stack([np.sin(phi), np.cos(phi), zeros], -1),
+                      np.stack([zeros, zeros, ones], -1)], -2)
+    zeros, ones = np.zeros_like(tilt), np.ones_like(tilt)
+    rot_x = np.stack([np.stack([ones, zeros, zeros], -1),
+                      np.stack([zeros, np.cos(tilt), -np.sin(tilt)], -1),
+                      np.stack([zeros, np.sin(tilt), np.cos(tilt)], -1)], -2)
+    return np.matmul(rot_x, rot_z)
+
+
+class BraggPredictor:
+    """
+    Predicts detector positions (mm, same axes as AxesUnits.MM) of Bragg peaks.
+    Two DWBA channels are considered: scattering of the incident beam and of the beam
+    reflected from the substrate. critical_angle (deg) of the layer gives refraction correction,
+    0 means no correction (kinematic approximation).
+    """
+    def __init__(self, exp_config, critical_angle=None, max_index=6):
+        self.m_detector_builder = DetectorBuilder(exp_config)
+        self.m_wavenumber = 2.0*np.pi/exp_config["beam_wavelength"]  # 1/nm
+        self.m_inclination_angle = np.radians(exp_config["inclination_angle"])
+        critical_angle = exp_config.get("critical_angle", 0.0) if critical_angle is None else critical_angle
+        self.m_critical_angle = np.radians(critical_angle)
+        self.m_hkl = miller_indices(max_index)
+
+        builder = self.m_detector_builder
+        self.m_distance = builder.m_distance
+        self.m_u0 = builder.m_center_x*builder.base_pixel_size()
+        self.m_v0 = (builder.full_ny - builder.m_center_y)*builder.base_pixel_size()
+        self.m_width = builder.m_nx*builder.pixel_size()
+        self.m_height = builder.m_ny*builder.pixel_size()
+        # detector perpendicular to direct beam: normal along k_i, u along -y, v up
+        alpha = self.m_inclination_angle
+        self.m_normal = np.array([np.cos(alpha), 0.0, -np.sin(alpha)])
+        self.m_u_unit = np.array([0.0, -1.0, 0.0])
+        self.m_v_unit = np.array([np.sin(alpha), 0.0, np.cos(alpha)])
+
+    def exit_vectors(self, g_vectors):
+        """
+        Returns external wave vectors k_f (batch, n, channels=2, 3) and excitation errors
+        (batch, n, 2) for given reciprocal vectors. Peaks going into the substrate have NaN k_f.
+        """
+        k = self.m_wavenumber
+        alpha_i, alpha_c = self.m_inclination_angle, self.m_critical_angle
+        kappa = k*np.sqrt(max(np.sin(alpha_i)**2 - np.sin(alpha_c)**2, 0.0))  # |k_iz| inside layer
+
+        kx = k*np.cos(alpha_i) + g_vectors[..., 0]
+        ky = g_vectors[..., 1]
+        # direct channel: q_z = p + kappa, reflected incident beam: q_z = p - kappa
+        p = np.stack([g_vectors[..., 2] - kappa, g_vectors[..., 2] + kappa], axis=-1)
+        kz = np.sqrt(p*p + (k*np.sin(alpha_c))**2)
+        kz = np.where(p > 0.0, kz, np.nan)
+
+        kx, ky = np.broadcast_to(kx[..., np.newaxis], kz.shape), np.broadcast_to(ky[..., np.newaxis], kz.shape)
+        k_f = np.stack([kx, ky, kz], axis=-1)
+        excitation = np.sqrt(kx*kx + ky*ky + kz*kz) - k
+        return k_f, excitation
+
+    def project(self, k_f):
+        """
+        Returns detector coordinates u, v (mm) of rays with given direction.
+        """
+        t = self.m_distance/np.tensordot(k_f, self.m_normal, axes=1)
+        u = self.m_u0 + t*np.tensordot(k_f, self.m_u_unit, axes=1)
+        v = self.m_v0 + t*np.tensordot(k_f, self.m_v_unit, axes=1)
+        return u, v
+
+    def predict(self, lattice_length_a, lattice_length_c, rotation_z=0.0, rotation_x=0.0, tolerance=0.05):
+        """
+        Returns dictionary with arrays of shape (batch, n_hkl, 2) for the batch of parameters
+        (arrays broadcast to common length): "u", "v" (mm), "excitation" (1/nm) and "visible"
+        (peak is on detector and Ewald sphere is within tolerance from reciprocal lattice point).
+        """
+        a, c, phi, tilt = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float)) for x in
+                                                (lattice_length_a, lattice_length_c, rotation_z, rotation_x)])
+        g_vectors = reciprocal_vectors(a, c, self.m_hkl)
+        g_vectors = np.matmul(g_vectors, np.transpose(rotation_matrices(phi, tilt), (0, 2, 1)))
+        k_f, excitation = self.exit_vectors(g_vectors)
+        with np.errstate(invalid="ignore"):
+            u, v = self.project(k_f)
+            visible = (np.abs(excitation) <= tolerance) & (u >= 0.0) & (u <= self.m_width) & \
+                      (v >= 0.0) & (v <= self.m_height)
+        return {"u": u, "v": v, "excitation": excitation, "visible": visible}
+
+    def peak_distances(self, prediction, xpeaks, ypeaks, group=1):
+        """
+        Returns array (batch/group, n_peaks) of distances (mm) from experimental peaks to the
+        nearest visible predicted peak. Consecutive group entries of the batch are combined,
+        i.e. all rotation_z values of the rotated ensemble.
+        """
+        nsets = len(prediction["u"])//group
+        u = prediction["u"].reshape(nsets, -1)
+        v = prediction["v"].reshape(nsets, -1)
+        visible = prediction["visible"].reshape(nsets, -1)
+        peaks = np.stack([xpeaks, ypeaks], axis=-1)
+        result = np.full((nsets, len(peaks)), np.inf)
+        for index in range(nsets):
+            points = np.stack([u[index][visible[index]], v[index][visible[index]]], axis=-1)
+            if len(points):
+                diff = peaks[:, np.newaxis, :] - points[np.newaxis, :, :]
+                result[index] = np.sqrt(np.min(np.sum(diff*diff, axis=2), axis=1))
+        return result
+
+    def score(self, lattice_length_a, lattice_length_c, rotation_z=0.0, rotation_x=0.0, tolerance=0.05,
+              batch_size=256):
+        """
+        Returns median distance (mm) from experimental peaks (xpeaks, ypeaks of exp_config) to the
+        predicted ones for every lattice of the batch, predicted peaks of all given rotation_z
+        values are combined (ensemble of rotated mesocrystals).
+        Lattices are processed in chunks of about batch_size orientations to limit memory.
+        """
+        builder = self.m_detector_builder
+        a, c = np.broadcast_arrays(np.atleast_1d(lattice_length_a), np.atleast_1d(lattice_length_c))
+        phi = np.atleast_1d(rotation_z)
+        chunk = max(batch_size//len(phi), 1)
+        result = []
+        for start in range(0, len(a), chunk):
+            chunk_a, chunk_c = a[start:start+chunk], c[start:start+chunk]
+            prediction = self.predict(np.repeat(chunk_a, len(phi)), np.repeat(chunk_c, len(phi)),
+                                      np.tile(phi, len(chunk_a)), rotation_x, tolerance)
+            distances = self.peak_distances(prediction, builder.m_xpeaks, builder.m_ypeaks, len(phi))
+            result.append(np.median(distances, axis=1))
+        return np.concatenate(result)
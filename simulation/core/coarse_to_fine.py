@@ -0,0 +1,64 @@
+"""
+Coarse-to-fine scan driver: all candidates are simulated on binned (coarse) detector,
+only the best ones are simulated again at full resolution.
+"""
+import copy
+import numpy as np
+from .simulation_builder import SimulationBuilder
+from .metrics import log_chi2
+
+
+class CoarseToFine:
+    """
+    Runs sample configs on coarse detector with given ScanExecutor, ranks them by the metric
+    against equally binned experimental data and keeps the best candidates.
+    """
+    def __init__(self, executor, binning=4, keep=3, metric=log_chi2):
+        self.m_executor = executor
+        self.m_binning = binning
+        self.m_keep = keep
+        self.m_metric = metric
+        self.m_coarse_metrics = []
+
+    def coarse_config(self, exp_config):
+        result = copy.deepcopy(exp_config)
+        result["binning"] = self.m_binning
+        return result
+
+    def coarse_scan(self, exp_config, sample_configs):
+        """
+        Simulates all configs on coarse detector, returns list of metric values.
+        """
+        coarse_exp_config = self.coarse_config(exp_config)
+        self.m_executor.set_title("Coarse scan, binning {}".format(self.m_binning))
+        for sample_config in sample_configs:
+            self.m_executor.add_point(coarse_exp_config, sample_config)
+        arrays = self.m_executor.results()
+
+        exp_array = SimulationBuilder(coarse_exp_config, sample_configs[0]).experimentalData().array()
+        self.m_coarse_metrics = [self.m_metric(array, exp_array) for array in arrays]
+        return self.m_coarse_metrics
+
+    def best_candidates(self):
+        """
+        Returns indices of the best candidates found by coarse_scan, best first.
+        """
+        return [int(index) for index in np.argsort(self.m_coarse_metrics)[:self.m_keep]]
+
+    def run(self, exp_config, sample_configs):
+        """
+        Runs coarse scan, then simulates the best candidates at full resolution.
+        Returns list of (index, coarse_metric, fine_metric) of the best candidates, best first.
+        """
+        self.coarse_scan(exp_config, sample_configs)
+        candidates = self.best_candidates()
+
+        self.m_executor.set_title("Fine scan")
+        for index in candidates:
+            self.m_executor.add_point(exp_config, sample_configs[index])
+        arrays = self.m_executor.results()
+
+        exp_array = SimulationBuilder(exp_config, sample_configs[0]).experimentalData().array()
+        result = [(index, self.m_coarse_metrics[index], self.m_metric(array, exp_array))
+                  for index, array in zip(candidates, arrays)]
+        return sorted(result, key=lambda item: item[2])
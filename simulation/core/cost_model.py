@@ -0,0 +1,192 @@
+"""
+Runtime cost model of scan points and longest job first scheduling.
+Runtime is predicted from config features by log-linear model, log(time) = w * log(features).
+Weights start from rough defaults and are calibrated on points recorded in ScanStore.
+"""
+import heapq
+import json
+import math
+import time
+import numpy as np
+from .detector_builder import DetectorBuilder
+from .mesocrystal_factory import RotatedMesoFactory
+from .create_mesocrystal_builder import create_mesocrystal_builder
+from .create_layout_factory import create_layout_factory
+
+feature_names = ("intercept", "pixels", "mc_points", "meso_work", "basis", "diffuse")
+
+# time ~ 1e-8 s * pixels * mc_points * mesocrystals * nparticles * basis^0.3
+default_weights = (math.log(1e-8), 1.0, 1.0, 1.0, 0.3, 0.1)
+
+random_layouts = ("RandomMesoFactory", "LargeRandomMesoFactory", "SmallRandomMesoFactory")
+
+
+def layout_mesocrystals(sample_config):
+    """
+    Returns list of (number of distinct mesocrystals, radius, height) for mesocrystal layouts
+    of the sample. Random layouts take the size from their factory, binning is accounted for.
+    """
+    result = []
+    for layout in sample_config.get("layouts", []):
+        size = (sample_config.get("meso_radius", 0.0), sample_config.get("meso_height", 0.0))
+        if layout == "SingleMesoFactory":
+            result.append((1,) + size)
+        elif layout in random_layouts:
+            factory = create_layout_factory(layout, sample_config)
+            result.append((factory.distinct_count(), factory.generate_radius(), factory.generate_height()))
+        elif layout == "RotatedMesoFactory":
+            factory = RotatedMesoFactory(sample_config)
+            orientations = factory.orientations()
+            if factory.m_fold_symmetry:
+                phi_period = create_mesocrystal_builder(sample_config, None).phi_period()
+                orientations = factory.fold_orientations(orientations, phi_period)
+            result.append((len(orientations),) + size)
+    return result
+
+
+def mesocrystal_count(sample_config):
+    """
+    Returns number of distinct mesocrystals in all layouts of the sample.
+    """
+    return sum(count for count, _, _ in layout_mesocrystals(sample_config))
+
+
+def basis_size(sample_config, layouts=None):
+    """
+    Returns approximate number of nanoparticles in the mesocrystal (3 per hexagonal unit cell),
+    averaged over mesocrystals of all layouts (as given by layout_mesocrystals).
+    """
+    a, c = sample_config["lattice_length_a"], sample_config["lattice_length_c"]
+    cell_volume = a*a*math.sqrt(3.0)/2.0*c
+    layouts = layout_mesocrystals(sample_config) if layouts is None else layouts
+    total = sum(count for count, _, _ in layouts)
+    if total == 0:
+        return 0.0
+    meso_volume = sum(count*math.pi*radius**2*height for count, radius, height in layouts)/total
+    return 3.0*meso_volume/cell_volume
+
+
+def config_features(exp_config, sample_config):
+    """
+    Returns dictionary of cost features of the scan point.
+    """
+    detector_builder = DetectorBuilder(exp_config)
+    xlow, ylow, xup, yup = detector_builder.region_of_interest()
+    pixels = (xup - xlow)*(yup - ylow)/detector_builder.pixel_size()**2
+    mc_points = exp_config.get("mc_points", 50) if exp_config.get("integration") else 1
+    nparticles = sample_config.get("nparticles", 1) if sample_config.get("meso_builder_type") == "FuzzyCylinder" else 1
+    diffuse = 0
+    if "RandomSizeParticles" in sample_config.get("layouts", []):
+        diffuse = sample_config.get("RandomSizeParticles", {}).get("distribution_points", 100) + 100
+    layouts = layout_mesocrystals(sample_config)
+    meso_count = sum(count for count, _, _ in layouts)
+    return {"pixels": pixels, "mc_points": mc_points, "meso_work": meso_count*nparticles,
+            "basis": basis_size(sample_config, layouts), "diffuse": diffuse}
+
+
+def feature_vector(features):
+    return np.array([1.0] + [math.log1p(features[name]) for name in feature_names[1:]])
+
+
+class CostModel:
+    """
+    Predicts simulation time (sec) of the scan point. Calibration is ridge regression on log times,
+    regularized towards the current weights, so few recorded points only correct the defaults.
+    """
+    def __init__(self, weights=default_weights):
+        self.m_weights = np.array(weights, dtype=float)
+        self.m_samples = 0
+
+    def features(self, exp_config, sample_config):
+        """
+        Returns feature vector or None if configs can't be analyzed (i.e. other sample builders).
+        """
+        try:
+            return feature_vector(config_features(exp_config, sample_config))
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            return None
+
+    def predict(self, exp_config, sample_config):
+        x = self.features(exp_config, sample_config)
+        if x is None:
+            return 1.0
+        return float(math.exp(np.dot(self.m_weights, x)))
+
+    def calibrate(self, runs, regularization=1.0):
+        """
+        Calibrates weights on list of (exp_config, sample_config, time_spend) of recorded runs.
+        Runs taken from the cache (zero time) are skipped. Returns number of runs used.
+        """
+        rows, times = [], []
+        for exp_config, sample_config, time_spend in runs:
+            x = self.features(exp_config, sample_config)
+            if x is not None and time_spend > 0.0:
+                rows.append(x)
+                times.append(math.log(time_spend))
+        if not rows:
+            return 0
+        x, y = np.array(rows), np.array(times)
+        prior = np.eye(len(feature_names))*regularization
+        self.m_weights = np.linalg.solve(x.T.dot(x) + prior, x.T.dot(y) + prior.dot(self.m_weights))
+        self.m_samples += len(rows)
+        return len(rows)
+
+    def calibrate_from_stores(self, stores):
+        runs = []
+        for store in stores:
+            runs += [(record["exp_config"], record["sample_config"], record.get("time_spend", 0.0))
+                     for record in store.all_records()]
+        return self.calibrate(runs)
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"features": feature_names, "weights": list(self.m_weights), "samples": self.m_samples}, f, indent=2)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            data = json.load(f)
+        result = cls(data["weights"])
+        result.m_samples = data.get("samples", 0)
+        return result
+
+
+def lpt_makespan(costs, workers):
+    """
+    Returns completion time of jobs run longest first on given number of workers.
+    """
+    loads = [0.0]*max(workers, 1)
+    for cost in sorted(costs, reverse=True):
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads)
+
+
+class ScanProgress:
+    """
+    Tracks finished scan points and estimates remaining time of the scan. Predicted costs are
+    rescaled by the ratio of actual to predicted time of points finished so far.
+    """
+    def __init__(self, costs, workers):
+        self.m_costs = dict(costs)  # index -> predicted time
+        self.m_workers = workers
+        self.m_start = time.time()
+        self.m_actual, self.m_predicted = 0.0, 0.0
+
+    def done(self, index, time_spend):
+        cost = self.m_costs.pop(index)
+        if time_spend > 0.0:  # not taken from cache
+            self.m_actual += time_spend
+            self.m_predicted += cost
+
+    def ratio(self):
+        return self.m_actual/self.m_predicted if self.m_predicted > 0.0 else 1.0
+
+    def eta(self):
+        """
+        Returns estimated remaining time (sec) of the scan.
+        """
+        return lpt_makespan([cost*self.ratio() for cost in self.m_costs.values()], self.m_workers)
+
+    def message(self):
+        return "{} points left, elapsed {:.0f} sec, ETA {:.0f} sec".format(
+            len(self.m_costs), time.time() - self.m_start, self.eta())
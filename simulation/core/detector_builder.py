@@ -1,36 +1,179 @@
 import bornagain as ba
+import numpy as np
 
 
 class DetectorBuilder:
     """
     Creates rectangular detector corresponding to 004_230_P144_im_full.int.gz
+    In peak mode ("peak_mode": true in exp_config) only small elliptical windows around
+    experimental peaks are simulated.
+    Optional "binning" (2, 4, 8) makes detector with correspondingly larger pixels, covering
+    the same area. Pixel coordinates in exp_config always refer to the full resolution.
     """
+    full_nx = 1024
+    full_ny = 1024
+
     def __init__(self, exp_config):
         self.m_config = exp_config
         self.m_distance = 909.99  # mm
-        self.m_pixel_size = 4 * 41.74e-3  # mm
-        self.m_nx = 1024
-        self.m_ny = 1024
+        self.m_binning = exp_config.get("binning", 1)
+        if self.full_nx % self.m_binning or self.full_ny % self.m_binning:
+            raise ValueError("Binning {} doesn't divide detector size".format(self.m_binning))
+        self.m_base_pixel_size = 4 * 41.74e-3  # mm
+        self.m_pixel_size = self.m_base_pixel_size*self.m_binning
+        self.m_nx = self.full_nx // self.m_binning
+        self.m_ny = self.full_ny // self.m_binning
         # probably specular beam position in pixel coordinates
         self.m_center_x = exp_config["center_x"]  # distance from left in pixels
         self.m_center_y = exp_config["center_y"]  # distance from top in pixels
         self.m_xpeaks = exp_config["xpeaks"]
         self.m_ypeaks = exp_config["ypeaks"]
-        self.peak_radius = 1.6
+        self.peak_radius = exp_config.get("peak_radius", 1.6)
+        self.m_peak_mode = exp_config.get("peak_mode", False)
+        self.m_roi = tuple(exp_config.get("roi", (30.0, 21.0, 65.0, 58.0)))  # basic
+        # self.m_roi = (30.0, 21.0, 50.0, 43.0)  # smaller
+        # self.m_roi = (41.0, 26.0, 47.0, 34.0)  # singlepeak
 
     def pixel_size(self):
         return self.m_pixel_size
 
+    def geometry(self):
+        """
+        Returns dictionary of settings defining pixels, region of interest and masks.
+        """
+        return {"center_x": self.m_center_x, "center_y": self.m_center_y, "binning": self.m_binning,
+                "roi": list(self.region_of_interest()), "peak_mode": self.m_peak_mode,
+                "apply_masks": self.m_config["apply_masks"], "xpeaks": list(self.m_xpeaks),
+                "ypeaks": list(self.m_ypeaks), "peak_radius": self.peak_radius}
+
+    def base_pixel_size(self):
+        """
+        Returns pixel size of the detector at full resolution.
+        """
+        return self.m_base_pixel_size
+
+    def binning(self):
+        return self.m_binning
+
     def create_detector(self):
         width, height = self.m_nx*self.m_pixel_size, self.m_ny*self.m_pixel_size
-        u0 = self.m_center_x*self.m_pixel_size
-        v0 = (self.m_ny - self.m_center_y)*self.m_pixel_size
+        u0 = self.m_center_x*self.m_base_pixel_size
+        v0 = (self.full_ny - self.m_center_y)*self.m_base_pixel_size
         result = ba.RectangularDetector(self.m_nx, width, self.m_ny, height)
         result.setPerpendicularToDirectBeam(self.m_distance, u0, v0)
         return result
 
+    def axes_metadata(self):
+        """
+        Returns description of axes in mm of intensity arrays cropped to the region of interest,
+        to store along with them. Edges are pixel boundaries, the first row is the top one.
+        """
+        rows, cols = self.roi_window()
+        ny, nx = self.roi_shape()
+        iy_low = self.m_ny - rows.stop
+        return {"nx": nx, "ny": ny, "units": "mm", "binning": self.m_binning,
+                "roi": list(self.region_of_interest()),
+                "xmin": cols.start*self.m_pixel_size, "xmax": cols.stop*self.m_pixel_size,
+                "ymin": iy_low*self.m_pixel_size, "ymax": (iy_low + ny)*self.m_pixel_size,
+                "detector_nx": self.m_nx, "detector_ny": self.m_ny}
+
+    def full_pixel_centers(self):
+        """
+        Returns x and y coordinates (mm) of pixel centers of the whole detector in the order of
+        rows and columns of full detector arrays: x grows left to right, first row is the top one.
+        """
+        x = (np.arange(self.m_nx) + 0.5)*self.m_pixel_size
+        y = (self.m_ny - np.arange(self.m_ny) - 0.5)*self.m_pixel_size
+        return x, y
+
+    def bin_index(self, value, nbins):
+        # same as FixedBinAxis::findClosestIndex used by RegionOfInterest
+        return int(np.clip(np.floor(value/self.m_pixel_size), 0, nbins-1))
+
+    def roi_window(self, peak_mode=None):
+        """
+        Returns (rows, cols) slices of the region of interest in full detector arrays.
+        Simulation results and converted experimental data are cropped to this window.
+        """
+        xlow, ylow, xup, yup = self.region_of_interest(peak_mode)
+        col_low, col_up = self.bin_index(xlow, self.m_nx), self.bin_index(xup, self.m_nx)
+        iy_low, iy_up = self.bin_index(ylow, self.m_ny), self.bin_index(yup, self.m_ny)
+        # first row is the top one
+        return slice(self.m_ny-1-iy_up, self.m_ny-iy_low), slice(col_low, col_up+1)
+
+    def roi_shape(self, peak_mode=None):
+        rows, cols = self.roi_window(peak_mode)
+        return rows.stop - rows.start, cols.stop - cols.start
+
+    def pixel_centers(self, peak_mode=None):
+        """
+        Returns x and y coordinates (mm) of pixel centers in the order of rows and columns of
+        intensity arrays cropped to the region of interest (result.array(), experimental data):
+        x grows left to right, first row is the top one.
+        """
+        rows, cols = self.roi_window(peak_mode)
+        x, y = self.full_pixel_centers()
+        return x[cols], y[rows]
+
+    def peak_mask(self, radius=None, peak_mode=None):
+        """
+        Returns boolean array (ROI shape) marking pixels inside the ellipses around experimental
+        peaks, the same ellipses as in apply_masks.
+        """
+        radius = self.peak_radius if radius is None else radius
+        x, y = self.pixel_centers(peak_mode)
+        result = np.zeros((len(y), len(x)), dtype=bool)
+        for xp, yp in zip(self.m_xpeaks, self.m_ypeaks):
+            result |= ((x[np.newaxis, :] - xp)/radius)**2 + ((y[:, np.newaxis] - yp)/(radius*2))**2 <= 1.0
+        return result
+
+    def region_of_interest(self, peak_mode=None):
+        """
+        Returns (xlow, ylow, xup, yup) of region of interest in mm. In peak mode it is
+        the bounding box of all peak windows.
+        """
+        peak_mode = self.m_peak_mode if peak_mode is None else peak_mode
+        if not peak_mode:
+            return self.m_roi
+        r = self.peak_radius
+        return (max(min(self.m_xpeaks) - r, 0.0), max(min(self.m_ypeaks) - 2*r, 0.0),
+                min(max(self.m_xpeaks) + r, self.m_nx*self.m_pixel_size),
+                min(max(self.m_ypeaks) + 2*r, self.m_ny*self.m_pixel_size))
+
+    def roi_mask(self, peak_mode=None):
+        """
+        Returns boolean array (ROI shape) of pixels which are going to be simulated.
+        """
+        peak_mode = self.m_peak_mode if peak_mode is None else peak_mode
+        if peak_mode or self.m_config["apply_masks"]:
+            return self.peak_mask(peak_mode=peak_mode)
+        return np.ones(self.roi_shape(peak_mode), dtype=bool)
+
+    def peak_intensities(self, array, radius=None, peak_mode=None):
+        """
+        Returns array of intensities integrated within the ellipse around every experimental peak.
+        Array is cropped to the region of interest of given mode.
+        """
+        radius = self.peak_radius if radius is None else radius
+        array = np.asarray(array)
+        x, y = self.pixel_centers(peak_mode)
+        if array.shape != (len(y), len(x)):
+            raise ValueError("Array shape {} doesn't match region of interest {}".format(
+                array.shape, (len(y), len(x))))
+        result = np.zeros(len(self.m_xpeaks))
+        for index, (xp, yp) in enumerate(zip(self.m_xpeaks, self.m_ypeaks)):
+            cols = np.flatnonzero(np.abs(x - xp) <= radius)
+            rows = np.flatnonzero(np.abs(y - yp) <= 2*radius)
+            if not len(cols) or not len(rows):
+                continue
+            window = (slice(rows[0], rows[-1]+1), slice(cols[0], cols[-1]+1))
+            inside = ((x[window[1]][np.newaxis, :] - xp)/radius)**2 + \
+                     ((y[window[0]][:, np.newaxis] - yp)/(radius*2))**2 <= 1.0
+            result[index] = np.sum(array[window][inside])
+        return result
+
     def apply_masks(self, simulation):
-        if self.m_config["apply_masks"]:
+        if self.m_config["apply_masks"] or self.m_peak_mode:
             simulation.maskAll()
             for xp, yp in zip(self.m_xpeaks, self.m_ypeaks):
                 simulation.addMask(ba.Ellipse(xp, yp, self.peak_radius, self.peak_radius*2), False)
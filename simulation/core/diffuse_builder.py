@@ -4,6 +4,7 @@ Collection of builders to generate particle layouts generating diffuse scatterin
 import bornagain as ba
 from .meso_utils import random_gate
 from .layout_factory_base import LayoutFactory
+from .distributions import gaussian_nodes, add_particle_distribution
 import numpy.random as npr
 
 
@@ -15,11 +16,13 @@ class RandomSizeParticles(LayoutFactory):
         super().__init__(config)
         self.m_average_layer_thickness = config["average_layer_thickness"]
         self.m_meso_elevation = config["meso_elevation"]
+        self.m_distribution_points = config.get("RandomSizeParticles", {}).get("distribution_points", 100)
+        self.m_size_quadrature = config.get("size_quadrature", "uniform")
 
     def create_layout(self, particle_material):
         layout = ba.ParticleLayout()
         radius = 5.02
-        nparticles = 100
+        nparticles = self.m_distribution_points
         sigma = 0.3
         gauss_distr = ba.DistributionGaussian(radius, sigma)
         # scale_param = math.sqrt(math.log((sigma / radius) ** 2 + 1.0))
@@ -27,11 +30,18 @@ class RandomSizeParticles(LayoutFactory):
 
         particle = ba.Particle(particle_material, ba.FormFactorFullSphere(radius))
 
-        sigma_factor = 2.0
-        par_distr = ba.ParameterDistribution(
-            "/Particle/FullSphere/Radius", gauss_distr, nparticles, sigma_factor)
-        part_coll = ba.ParticleDistribution(particle, par_distr)
-        layout.addParticle(part_coll, 1.0, ba.kvector_t(0, 0, -self.m_average_layer_thickness))
+        position = ba.kvector_t(0, 0, -self.m_average_layer_thickness)
+        if self.m_size_quadrature == "gauss_hermite":
+            radii, weights = gaussian_nodes(radius, sigma, nparticles)
+            add_particle_distribution(
+                layout, lambda r: ba.Particle(particle_material, ba.FormFactorFullSphere(r)),
+                radii, weights, 1.0, position)
+        else:
+            sigma_factor = 2.0
+            par_distr = ba.ParameterDistribution(
+                "/Particle/FullSphere/Radius", gauss_distr, nparticles, sigma_factor)
+            part_coll = ba.ParticleDistribution(particle, par_distr)
+            layout.addParticle(part_coll, 1.0, position)
 
         for i in range(0, 100):
             radius = npr.normal(5.0, 0.3)
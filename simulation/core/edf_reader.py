@@ -0,0 +1,100 @@
+"""
+Reader of ESRF data format (EDF) files, plain or gzip compressed.
+Replaces fabio and obsolete/converters/edf_reader.py.
+"""
+import gzip
+import numpy as np
+
+h_c = 1.239842E4  # eV*Angstrom
+
+edf_data_types = {
+    "UnsignedByte": "u1", "SignedByte": "i1",
+    "UnsignedShort": "u2", "SignedShort": "i2",
+    "UnsignedInteger": "u4", "SignedInteger": "i4",
+    "UnsignedLong": "u4", "SignedLong": "i4",
+    "FloatValue": "f4", "Float": "f4", "DoubleValue": "f8",
+}
+
+
+def open_edf(filename):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rb")
+    return open(filename, "rb")
+
+
+def read_header(file_handler):
+    """
+    Reads header block enclosed in curly braces, returns dictionary of raw string values.
+    File position is left at the beginning of binary data.
+    """
+    header = dict()
+    line = file_handler.readline(4096)
+    if not line.strip().startswith(b"{"):
+        raise IOError("Not an EDF file, header doesn't start with '{'")
+    while b"}" not in line:
+        line = file_handler.readline(4096)
+        if not line:
+            raise IOError("Unexpected end of EDF header")
+        if b"=" in line:
+            key, value = line.decode("ascii", "replace").split("=", 1)
+            header[key.strip()] = value.strip().rstrip(";").strip()
+    return header
+
+
+def data_dtype(header):
+    data_type = header["DataType"]
+    if data_type not in edf_data_types:
+        raise IOError("Unknown data format in header: {}".format(data_type))
+    byte_order = "<" if header.get("ByteOrder", "LowByteFirst") == "LowByteFirst" else ">"
+    return np.dtype(edf_data_types[data_type]).newbyteorder(byte_order)
+
+
+def read_edf(filename):
+    """
+    Returns (data, header) of EDF file. Gzip payload is decompressed directly into preallocated
+    array of the type given in header, without intermediate copies. Array shape is (Dim_2, Dim_1).
+    """
+    with open_edf(filename) as file_handler:
+        header = read_header(file_handler)
+        data = np.empty((int(header["Dim_2"]), int(header["Dim_1"])), dtype=data_dtype(header))
+        buffer = memoryview(data.reshape(-1).view(np.uint8))
+        nbytes = 0
+        while nbytes < len(buffer):
+            nread = file_handler.readinto(buffer[nbytes:])
+            if not nread:
+                raise IOError("Unexpected end of EDF data in '{}': {} of {} bytes".format(
+                    filename, nbytes, len(buffer)))
+            nbytes += nread
+    return data, header
+
+
+def header_settings(header):
+    """
+    Returns commonly used header values converted to numbers (distances in mm, wavelength in Angstrom).
+    """
+    result = dict()
+    if 'Dim_1' in header:
+        result['xdim'] = int(header['Dim_1'])
+    if 'Dim_2' in header:
+        result['ydim'] = int(header['Dim_2'])
+    if 'Distance_sample-detector' in header:
+        result['distance'] = float(header['Distance_sample-detector'].rstrip('mm'))
+    if 'SampleDistance' in header:
+        result['distance'] = float(header['SampleDistance'].rstrip('m'))*1000.
+    if 'Monochromator_energy' in header:
+        result['lambda'] = h_c/(float(header['Monochromator_energy'].rstrip('keV'))*1000.)
+    if 'WaveLength' in header:
+        result['lambda'] = float(header['WaveLength'].rstrip('m'))*1e10
+    if 'ExposureTime' in header:
+        result['exposure_time'] = float(header['ExposureTime'].rstrip('s (Seconds)'))
+    if 'Exposure_time' in header:
+        result['exposure_time'] = float(header['Exposure_time'].rstrip('ms'))/1000.
+    if 'Center_1' in header:
+        result['center_x'] = float(header['Center_1'].rstrip('pixel'))
+    if 'Center_2' in header:
+        result['center_y'] = float(header['Center_2'].rstrip('pixel'))
+    if 'PSize_1' in header:
+        result['pixel_size_x'] = float(header['PSize_1'].rstrip('m'))*1e3
+    if 'PSize_2' in header:
+        result['pixel_size_y'] = float(header['PSize_2'].rstrip('m'))*1e3
+    return result
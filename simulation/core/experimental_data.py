@@ -0,0 +1,126 @@
+"""
+Loads experimental data once per process.
+Decoded intensities are stored as float32 .npy next to the original file and memory mapped
+on subsequent loads. Data converted to simulation units are kept in memory per detector geometry.
+Rebinned data (sum over binning x binning pixel blocks) are cached the same way.
+Dead pixels (negative values, -20000 in the detector images) are excluded from rebinned sums.
+"""
+import os
+import glob
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import bornagain as ba
+from .edf_reader import read_edf
+
+data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+
+_arrays = dict()
+_converted = OrderedDict()
+_max_converted = 8
+
+
+def data_path(filename):
+    """
+    Returns absolute path of data file, relative names are looked up in the data directory.
+    """
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(data_dir, os.path.basename(filename))
+
+
+def decode(path):
+    """
+    Returns intensity array of the file in original format. Raw EDF rows are already
+    in the order of IHistogram.array() (first row is the top one).
+    """
+    if path.endswith(".edf") or path.endswith(".edf.gz"):
+        return read_edf(path)[0]
+    return ba.IHistogram.createFrom(path).array()
+
+
+rebin_version = 2  # part of cache file names of rebinned data
+
+
+def rebin(array, binning, dead_value=-1.0):
+    """
+    Returns array with intensities summed over binning x binning blocks of pixels.
+    Negative (dead) pixels are excluded, the sum of valid pixels is scaled to the full block.
+    Blocks without valid pixels get dead_value.
+    """
+    ny, nx = array.shape
+    blocks = array.reshape(ny//binning, binning, nx//binning, binning)
+    valid = blocks >= 0.0
+    count = np.sum(valid, axis=(1, 3))
+    total = np.sum(np.where(valid, blocks, 0.0), axis=(1, 3))
+    return np.where(count > 0, total*binning*binning/np.maximum(count, 1), dead_value)
+
+
+def cache_path(path, binning=1):
+    return path + ".npy" if binning == 1 else "{}.bin{}.v{}.npy".format(path, binning, rebin_version)
+
+
+def load_array(filename, binning=1):
+    """
+    Returns read-only float32 intensity array of the data file. File is decoded (rebinned) only once,
+    the result is saved in .npy file next to it and memory mapped afterwards.
+    """
+    path = data_path(filename)
+    key = (path, binning)
+    if key in _arrays:
+        return _arrays[key]
+
+    npy_path = cache_path(path, binning)
+    if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(path):
+        if binning == 1:
+            print("ExperimentalData > decoding '{}'".format(path))
+            array = np.asarray(decode(path), dtype=np.float32)
+        else:
+            array = rebin(np.asarray(load_array(filename), dtype=np.float64), binning).astype(np.float32)
+        tmp_path = "{}.{}.tmp.npy".format(npy_path[:-4], os.getpid())
+        np.save(tmp_path, array)
+        os.replace(tmp_path, npy_path)
+
+    _arrays[key] = np.load(npy_path, mmap_mode='r')
+    return _arrays[key]
+
+
+def pyramid(filename, factors=(2, 4, 8)):
+    """
+    Returns dictionary binning -> rebinned array, computing missing levels once.
+    """
+    return {binning: load_array(filename, binning) for binning in (1,) + tuple(factors)}
+
+
+def converted_data(filename, geometry_key, create_simulation, binning=1):
+    """
+    Returns experimental data converted to the units of simulation (SimulationResult).
+    Conversion is done once per data file and detector geometry, create_simulation is
+    called only when the conversion is necessary. Results for recently used geometries are kept.
+    """
+    key = (data_path(filename), geometry_key)
+    if key in _converted:
+        _converted.move_to_end(key)
+        return _converted[key]
+    array = np.asarray(load_array(filename, binning), dtype=np.float64)
+    _converted[key] = ba.ConvertData(create_simulation(), array)
+    if len(_converted) > _max_converted:
+        _converted.popitem(last=False)
+    return _converted[key]
+
+
+def cache_file(filename):
+    """
+    Decodes single data file into .npy cache, returns the name of the cache file.
+    """
+    load_array(filename)
+    return cache_path(data_path(filename))
+
+
+def convert_all(pattern="*.edf.gz", workers=None):
+    """
+    Decodes all data files matching the pattern (in data directory) into .npy caches in parallel.
+    """
+    filenames = sorted(glob.glob(os.path.join(data_dir, pattern)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(cache_file, filenames))
@@ -0,0 +1,125 @@
+"""
+Persistent figure templates for report plots.
+Figure layout (axes, colormaps, lines) is created once per scan on the Agg canvas, without
+pyplot, and only image and line data are replaced for every scan point. Rendered RGBA
+buffers can be encoded to PNG in background thread or process pool.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm
+from matplotlib import image as mpimg
+import bornagain as ba
+from .result_slicer import slicer
+
+
+def write_png(filename, rgba):
+    mpimg.imsave(filename, rgba)
+
+
+class PngWriter:
+    """
+    Writes rendered RGBA buffers to PNG files in background workers ("thread" or "process"),
+    or immediately when workers=0.
+    """
+    def __init__(self, workers=0, mode="thread"):
+        self.m_pool = None
+        if workers > 0:
+            pool_type = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+            self.m_pool = pool_type(max_workers=workers)
+        self.m_pending = []
+
+    def write(self, filename, rgba):
+        if self.m_pool is None:
+            write_png(filename, rgba)
+            return
+        self.m_pending.append(self.m_pool.submit(write_png, filename, rgba))
+
+    def wait(self):
+        """
+        Waits until all files are written, re-raises errors of the workers.
+        """
+        for future in self.m_pending:
+            future.result()
+        self.m_pending = []
+
+    def close(self):
+        self.wait()
+        if self.m_pool:
+            self.m_pool.shutdown()
+
+
+class AlongYTemplate:
+    """
+    Same layout as run_simulation.plot_alongy: experimental and simulated colormaps with
+    vertical lines at xpeaks and intensity projections along y around every line.
+    Experimental data are updated only when another object is given.
+    """
+    def __init__(self, units=ba.AxesUnits.MM, xpeaks=(32.95, 43.8, 47.8, 57.5, 62.9), zmin=1e+03, zmax=1e+07):
+        self.m_units = units
+        self.m_xpeaks = list(xpeaks)
+        self.m_zmin, self.m_zmax = zmin, zmax
+        self.m_figure = Figure(figsize=(16, 14), dpi=100)
+        self.m_canvas = FigureCanvasAgg(self.m_figure)
+        self.m_images = None
+        self.m_lines = None
+        self.m_exp_data = None
+
+    def masked(self, values):
+        return np.ma.masked_less_equal(values, 0.0)
+
+    def create_layout(self, exp_slicer, sim_slicer):
+        gs1 = self.m_figure.add_gridspec(1, 2, left=0.05, right=1.0, bottom=0.525, top=0.95, wspace=0.05)
+        self.m_images = []
+        for index, data_slicer in enumerate((exp_slicer, sim_slicer)):
+            ax = self.m_figure.add_subplot(gs1[index])
+            extent = data_slicer.x_range() + data_slicer.y_range()
+            im = ax.imshow(self.masked(data_slicer.m_values), origin="lower", extent=extent, aspect="auto",
+                           cmap="jet", norm=LogNorm(self.m_zmin, self.m_zmax))
+            self.m_figure.colorbar(im, ax=ax)
+            for x in self.m_xpeaks:
+                ax.plot([x, x], data_slicer.y_range(), color='gray', linestyle='-', linewidth=1)
+            self.m_images.append(im)
+
+        gs2 = self.m_figure.add_gridspec(2, 3, left=0.05, right=0.95, bottom=0.05, top=0.455, wspace=0.1)
+        self.m_lines = []
+        for index in range(len(self.m_xpeaks)):
+            ax = self.m_figure.add_subplot(gs2[index])
+            exp_line, = ax.semilogy(exp_slicer.m_y_centers, np.ones_like(exp_slicer.m_y_centers))
+            sim_line, = ax.semilogy(sim_slicer.m_y_centers, np.ones_like(sim_slicer.m_y_centers))
+            ax.set_xlim(*exp_slicer.y_range())
+            ax.set_ylim(1e+03, 1e+07)
+            self.m_lines.append((exp_line, sim_line))
+
+    def projections(self, data_slicer):
+        xmins = [x - 0.25 for x in self.m_xpeaks]
+        xmaxs = [x + 0.25 for x in self.m_xpeaks]
+        return data_slicer.projections_y(xmins, xmaxs)
+
+    def update(self, exp_data, sim_result):
+        """
+        Replaces image and line data by the given experimental data and simulation result.
+        """
+        exp_slicer, sim_slicer = slicer(exp_data, self.m_units), slicer(sim_result, self.m_units)
+        if self.m_images is None:
+            self.create_layout(exp_slicer, sim_slicer)
+
+        if exp_data is not self.m_exp_data:
+            self.m_exp_data = exp_data
+            self.m_images[0].set_data(self.masked(exp_slicer.m_values))
+            centers, values = self.projections(exp_slicer)
+            for (line, _), projection in zip(self.m_lines, values):
+                line.set_data(centers, projection+1)
+
+        self.m_images[1].set_data(self.masked(sim_slicer.m_values))
+        centers, values = self.projections(sim_slicer)
+        for (_, line), projection in zip(self.m_lines, values):
+            line.set_data(centers, projection+1)
+
+    def render(self):
+        """
+        Draws the figure, returns copy of RGBA buffer.
+        """
+        self.m_canvas.draw()
+        return np.array(self.m_canvas.buffer_rgba())
@@ -0,0 +1,212 @@
+"""
+Fitting of sample parameters to experimental data.
+Population based optimizer (differential evolution) submits all candidates of a generation
+to ScanExecutor, so they are simulated in parallel worker processes, and evaluates
+the objective for the whole population at once.
+"""
+import copy
+import json
+import os
+import time
+import numpy as np
+from .simulation_builder import SimulationBuilder
+from .metrics import poisson_deviance
+
+
+def get_config_value(config, key):
+    """
+    Returns config value for dotted key, i.e. "RotatedMesoFactory.layout_weight".
+    """
+    names = key.split(".")
+    for name in names[:-1]:
+        config = config[name]
+    return config[names[-1]]
+
+
+def set_config_value(config, key, value):
+    names = key.split(".")
+    for name in names[:-1]:
+        config = config[name]
+    config[names[-1]] = value
+
+
+class Objective:
+    """
+    Vectorized objective: takes list (stack) of simulated arrays, returns array of values.
+    Kind is "log_chi2" (mean squared difference of log10 intensities) or "poisson" (mean deviance).
+    """
+    kinds = ("log_chi2", "poisson")
+
+    def __init__(self, exp_array, mask, kind="log_chi2"):
+        if kind not in self.kinds:
+            raise ValueError("Unknown objective '{}', expected one of {}".format(kind, self.kinds))
+        if np.shape(mask) != np.shape(exp_array):
+            raise ValueError("Mask shape {} doesn't match experimental data {}".format(
+                np.shape(mask), np.shape(exp_array)))
+        self.m_kind = kind
+        self.m_mask = mask
+        self.m_exp_values = np.maximum(np.asarray(exp_array, dtype=float)[mask], 0.0)
+        self.m_exp_array = exp_array
+        self.m_log_exp = np.log10(self.m_exp_values + 1.0)
+
+    def __call__(self, arrays):
+        stack = np.asarray(arrays, dtype=float)
+        if self.m_kind == "poisson":
+            return np.atleast_1d(poisson_deviance(stack, self.m_exp_array, self.m_mask))
+        diff = np.log10(np.maximum(stack[:, self.m_mask], 0.0) + 1.0) - self.m_log_exp
+        return np.mean(diff*diff, axis=1)
+
+
+def create_objective(exp_config, sample_config, fit_config):
+    """
+    Returns Objective with experimental data, mask and kind defined by fit config.
+    Masks are in the geometry of experimental data, i.e. cropped to the region of interest.
+    """
+    builder = SimulationBuilder(exp_config, sample_config)
+    detector_builder = builder.m_detector_builder
+    mask = detector_builder.roi_mask()
+    if fit_config.get("mask", "roi") == "peaks":
+        mask = mask & detector_builder.peak_mask()
+    return Objective(builder.experimentalData().array(), mask, fit_config.get("objective", "log_chi2"))
+
+
+class Fitter:
+    """
+    Differential evolution (rand/1/bin) over free sample config keys within bounds.
+    State is saved to the checkpoint file after every generation, fit can be resumed from it.
+    Random numbers of every generation are derived from the seed and generation number,
+    so resumed fit goes exactly the same way as uninterrupted one.
+    """
+    def __init__(self, exp_config, sample_config, fit_config, executor, checkpoint_file=None):
+        self.m_exp_config = exp_config
+        self.m_sample_config = sample_config
+        self.m_executor = executor
+        self.m_checkpoint_file = checkpoint_file
+        self.m_names = [par["name"] for par in fit_config["parameters"]]
+        self.m_lower = np.array([par["min"] for par in fit_config["parameters"]], dtype=float)
+        self.m_upper = np.array([par["max"] for par in fit_config["parameters"]], dtype=float)
+        self.m_population_size = fit_config.get("population", 5*len(self.m_names))
+        self.m_generations = fit_config.get("generations", 30)
+        self.m_mutation = fit_config.get("mutation", 0.7)
+        self.m_crossover = fit_config.get("crossover", 0.9)
+        self.m_tolerance = fit_config.get("tolerance", 1e-3)
+        self.m_seed = fit_config.get("seed", 1)
+
+        self.m_objective = create_objective(exp_config, sample_config, fit_config)
+
+        self.m_generation = 0
+        self.m_population = None
+        self.m_values = None
+        self.m_trace = []
+
+    def random_state(self, generation):
+        return np.random.RandomState(self.m_seed + generation)
+
+    def candidate_config(self, x):
+        result = copy.deepcopy(self.m_sample_config)
+        for name, value in zip(self.m_names, x):
+            set_config_value(result, name, float(value))
+        return result
+
+    def evaluate(self, population, title):
+        self.m_executor.set_title(title)
+        for x in population:
+            self.m_executor.add_point(self.m_exp_config, self.candidate_config(x))
+        return self.m_objective(self.m_executor.results())
+
+    def initial_population(self):
+        """
+        Returns Latin hypercube sample of the parameter space.
+        """
+        rng = self.random_state(0)
+        n, ndim = self.m_population_size, len(self.m_names)
+        strata = (np.argsort(rng.random_sample((n, ndim)), axis=0) + rng.random_sample((n, ndim)))/n
+        return self.m_lower + strata*(self.m_upper - self.m_lower)
+
+    def trial_population(self, rng):
+        """
+        Returns mutated and crossed over population, out of bounds values are reflected back.
+        """
+        n, ndim = self.m_population.shape
+        result = np.empty_like(self.m_population)
+        for i in range(n):
+            a, b, c = rng.choice([j for j in range(n) if j != i], 3, replace=False)
+            mutant = self.m_population[a] + self.m_mutation*(self.m_population[b] - self.m_population[c])
+            cross = rng.random_sample(ndim) < self.m_crossover
+            cross[rng.randint(ndim)] = True
+            result[i] = np.where(cross, mutant, self.m_population[i])
+        result = np.where(result < self.m_lower, 2*self.m_lower - result, result)
+        result = np.where(result > self.m_upper, 2*self.m_upper - result, result)
+        return np.clip(result, self.m_lower, self.m_upper)
+
+    def converged(self):
+        mean = np.mean(self.m_values)
+        return np.std(self.m_values) <= self.m_tolerance*abs(mean) + 1e-12
+
+    def best(self):
+        """
+        Returns (value, dictionary of parameter values) of the best candidate.
+        """
+        index = int(np.argmin(self.m_values))
+        return float(self.m_values[index]), dict(zip(self.m_names, self.m_population[index].tolist()))
+
+    def record(self, start):
+        value, parameters = self.best()
+        entry = {"generation": self.m_generation, "best": value, "mean": float(np.mean(self.m_values)),
+                 "parameters": parameters, "time": time.time() - start}
+        self.m_trace.append(entry)
+        print("Fitter > generation:{} best:{:.5f} mean:{:.5f} {}".format(
+            self.m_generation, value, entry["mean"], parameters))
+
+    def save_checkpoint(self):
+        if not self.m_checkpoint_file:
+            return
+        state = {"names": self.m_names, "generation": self.m_generation,
+                 "population": self.m_population.tolist(), "values": self.m_values.tolist(),
+                 "trace": self.m_trace}
+        tmp_file = self.m_checkpoint_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, self.m_checkpoint_file)
+
+    def load_checkpoint(self):
+        """
+        Restores the state saved by previous run, returns False if there is nothing to restore.
+        """
+        if not self.m_checkpoint_file or not os.path.exists(self.m_checkpoint_file):
+            return False
+        with open(self.m_checkpoint_file) as f:
+            state = json.load(f)
+        if state["names"] != self.m_names:
+            raise ValueError("Checkpoint '{}' is for parameters {}".format(self.m_checkpoint_file, state["names"]))
+        self.m_generation = state["generation"]
+        self.m_population = np.array(state["population"])
+        self.m_values = np.array(state["values"])
+        self.m_trace = state["trace"]
+        return True
+
+    def run(self, resume=False):
+        """
+        Runs optimization, returns (value, parameters) of the best candidate.
+        """
+        start = time.time()
+        if not (resume and self.load_checkpoint()):
+            self.m_population = self.initial_population()
+            self.m_values = self.evaluate(self.m_population, "Fit, initial population")
+            self.record(start)
+            self.save_checkpoint()
+
+        while self.m_generation < self.m_generations and not self.converged():
+            self.m_generation += 1
+            trials = self.trial_population(self.random_state(self.m_generation))
+            values = self.evaluate(trials, "Fit, generation {}".format(self.m_generation))
+            improved = values <= self.m_values
+            self.m_population[improved] = trials[improved]
+            self.m_values[improved] = values[improved]
+            self.record(start)
+            self.save_checkpoint()
+
+        return self.best()
+
+    def best_config(self):
+        return self.candidate_config(self.m_population[int(np.argmin(self.m_values))])
@@ -0,0 +1,100 @@
+"""
+Post-hoc instrument model: detector resolution, beam intensity and constant background
+applied to the raw (unconvolved, unit beam intensity, no background) simulated pattern.
+Allows to scan instrument parameters without re-doing the scattering calculation.
+"""
+import copy
+import numpy as np
+from scipy import fft
+
+# experimental config keys which are handled by InstrumentModel and don't affect raw pattern
+instrument_keys = ("beam_intensity", "background", "det_sigma_factor")
+
+_kernels = dict()
+
+
+def raw_config(exp_config):
+    """
+    Returns experimental config of raw pattern, i.e. without instrument parameters.
+    Used as a cache key, so that raw patterns are shared by all instrument settings.
+    """
+    result = copy.deepcopy(exp_config)
+    for key in instrument_keys:
+        result.pop(key, None)
+    result["raw_mode"] = True
+    return result
+
+
+def gaussian_kernel_ft(shape, sigma_x, sigma_y):
+    """
+    Returns Fourier transform (rfft2 layout) of normalized Gaussian with sigmas given in pixels,
+    for padded array of given shape. Kernels are cached per shape and sigmas.
+    """
+    key = (shape, round(sigma_x, 6), round(sigma_y, 6))
+    if key not in _kernels:
+        fy = np.fft.fftfreq(shape[0])
+        fx = np.fft.rfftfreq(shape[1])
+        _kernels[key] = np.exp(-2.0*np.pi**2*((sigma_y*fy[:, np.newaxis])**2 + (sigma_x*fx[np.newaxis, :])**2))
+    return _kernels[key]
+
+
+def convolve_gaussian(array, sigma_x, sigma_y):
+    """
+    Returns array convolved with 2D Gaussian (sigmas in pixels). Array is zero padded by 4 sigma
+    to avoid wrap-around of FFT.
+    """
+    if sigma_x <= 0.0 and sigma_y <= 0.0:
+        return np.array(array, dtype=float)
+    ny, nx = array.shape
+    shape = (fft.next_fast_len(ny + int(np.ceil(4*sigma_y)) + 1),
+             fft.next_fast_len(nx + int(np.ceil(4*sigma_x)) + 1, real=True))
+    image_ft = fft.rfft2(array, shape)
+    return fft.irfft2(image_ft*gaussian_kernel_ft(shape, sigma_x, sigma_y), shape)[:ny, :nx]
+
+
+class InstrumentModel:
+    """
+    Applies detector resolution (Gaussian, sigma_y = 1.7 sigma_x as in SimulationBuilder),
+    beam intensity and constant background to raw pattern: intensity*(raw (x) G) + background.
+    Raw array is cropped to the region of interest, as any simulation result. Background is
+    added only to simulated (not masked) pixels, masked pixels are zero.
+    """
+    def __init__(self, exp_config, detector_builder):
+        self.m_beam_intensity = exp_config["beam_intensity"]
+        self.m_background = exp_config.get("background", 200.0)
+        self.m_resolution_sigma_factor = exp_config["det_sigma_factor"]
+        self.m_detector_builder = detector_builder
+        self.m_roi_mask = None
+
+    def sigmas(self):
+        """
+        Returns resolution sigmas (x, y) in pixels of the current (possibly binned) detector.
+        """
+        sigma_x = self.m_resolution_sigma_factor/self.m_detector_builder.binning()
+        return sigma_x, sigma_x*1.7
+
+    def roi_mask(self):
+        if self.m_roi_mask is None:
+            self.m_roi_mask = self.m_detector_builder.roi_mask()
+        return self.m_roi_mask
+
+    def apply(self, raw_array):
+        raw_array = np.asarray(raw_array, dtype=float)
+        mask = self.roi_mask()
+        if raw_array.shape != mask.shape:
+            raise ValueError("Raw array shape {} doesn't match region of interest {}".format(
+                raw_array.shape, mask.shape))
+        result = convolve_gaussian(raw_array, *self.sigmas())
+        result *= self.m_beam_intensity
+        # background per full resolution pixel, as in SimulationBuilder
+        result[mask] += self.m_background*self.m_detector_builder.binning()**2
+        result[~mask] = 0.0
+        return result
+
+    def set_parameters(self, beam_intensity=None, background=None, det_sigma_factor=None):
+        if beam_intensity is not None:
+            self.m_beam_intensity = beam_intensity
+        if background is not None:
+            self.m_background = background
+        if det_sigma_factor is not None:
+            self.m_resolution_sigma_factor = det_sigma_factor
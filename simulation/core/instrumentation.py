@@ -0,0 +1,128 @@
+"""
+Lightweight instrumentation of pipeline stages.
+Stages are wrapped in span(name) context managers. When enabled, every span writes one json
+line with wall time, CPU time and peak resident memory of the process. When disabled, span()
+returns shared no-op context manager.
+Enabling sets environment variable, so worker processes started afterwards write to the same file.
+"""
+import os
+import json
+import time
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+env_variable = "MESO_TIMINGS_FILE"
+
+_filename = None
+_stack = []
+_context = dict()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def peak_rss_mb():
+    """
+    Returns peak resident set size of the process in MB (0 if unknown).
+    """
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0  # kB on Linux
+
+
+def enable(filename):
+    """
+    Starts writing spans to the given json lines file (appending).
+    """
+    global _filename
+    _filename = os.path.abspath(filename)
+    os.environ[env_variable] = _filename
+
+
+def disable():
+    global _filename
+    _filename = None
+    os.environ.pop(env_variable, None)
+
+
+def enabled():
+    return _filename is not None
+
+
+def set_context(**kwargs):
+    """
+    Sets values added to all following records of this process (i.e. scan point index).
+    Value None removes the key.
+    """
+    for key, value in kwargs.items():
+        if value is None:
+            _context.pop(key, None)
+        else:
+            _context[key] = value
+
+
+class Span:
+    def __init__(self, name, attributes):
+        self.m_name = name
+        self.m_attributes = attributes
+
+    def __enter__(self):
+        _stack.append(self.m_name)
+        self.m_wall = time.perf_counter()
+        self.m_cpu = time.process_time()
+        self.m_rss = peak_rss_mb()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.m_wall
+        cpu = time.process_time() - self.m_cpu
+        rss = peak_rss_mb()
+        record = {"stage": "/".join(_stack), "name": self.m_name, "wall": wall, "cpu": cpu,
+                  "peak_rss_mb": rss, "peak_rss_growth_mb": rss - self.m_rss, "pid": os.getpid(),
+                  "time": time.time(), "failed": exc_type is not None}
+        record.update(_context)
+        record.update(self.m_attributes)
+        _stack.pop()
+        with open(_filename, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+        return False
+
+
+def span(name, **attributes):
+    """
+    Returns context manager measuring the stage with given name.
+    """
+    if _filename is None:
+        return _null_span
+    return Span(name, attributes)
+
+
+def summary(filename):
+    """
+    Returns dictionary stage -> (count, total wall, total cpu, max peak rss) of json lines file.
+    """
+    result = dict()
+    with open(filename) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            count, wall, cpu, rss = result.get(record["stage"], (0, 0.0, 0.0, 0.0))
+            result[record["stage"]] = (count+1, wall+record["wall"], cpu+record["cpu"],
+                                       max(rss, record["peak_rss_mb"]))
+    return result
+
+
+if os.environ.get(env_variable):
+    enable(os.environ[env_variable])
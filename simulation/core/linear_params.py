@@ -0,0 +1,144 @@
+"""
+Closed-form fit of the parameters entering detector image linearly.
+Intensities of particle layouts add up, so the image is sum_i scale_i*component_i + background,
+where component_i is the image of the i-th layout alone. Components are simulated once,
+optimal scales and background are then found by weighted least squares.
+"""
+import copy
+import numpy as np
+from scipy.optimize import nnls, least_squares
+from .metrics import roi_mask
+
+
+def component_configs(exp_config, sample_config):
+    """
+    Returns experimental config without background and list of (layout_name, sample_config)
+    with every layout of the sample alone.
+    """
+    exp_cfg = copy.deepcopy(exp_config)
+    exp_cfg["background"] = 0.0
+    result = []
+    for layout_name in sample_config["layouts"]:
+        cfg = copy.deepcopy(sample_config)
+        cfg["layouts"] = [layout_name]
+        result.append((layout_name, cfg))
+    return exp_cfg, result
+
+
+def simulate_components(exp_config, sample_config, executor):
+    """
+    Simulates every layout separately using given ScanExecutor. Returns list of layout names
+    and list of intensity arrays.
+    """
+    exp_cfg, configs = component_configs(exp_config, sample_config)
+    executor.set_title("Layout components")
+    for _, cfg in configs:
+        executor.add_point(exp_cfg, cfg)
+    return [name for name, _ in configs], executor.results()
+
+
+class LinearFit:
+    """
+    Finds non-negative scales of layout components and constant background reproducing
+    experimental data. Residuals are weighted by 1/sqrt(intensity) when poisson=True.
+    With log_space=True linear solution is refined by minimizing the difference of
+    decimal logarithms (same as metrics.log_chi2), refined scales are strictly positive
+    (zeros of the linear solution become negligibly small values).
+    Layouts share the average material of the layer, so the sum of components
+    is only approximately equal to the image of the full sample.
+    """
+    def __init__(self, names, components, exp_array, mask=None, poisson=True, log_space=False):
+        self.m_names = list(names)
+        self.m_components = np.asarray(components, dtype=float)
+        self.m_exp_array = np.asarray(exp_array, dtype=float)
+        self.m_mask = roi_mask(np.sum(self.m_components, axis=0)) if mask is None else mask
+        self.m_poisson = poisson
+        self.m_log_space = log_space
+        self.m_scales = None
+        self.m_background = 0.0
+
+    def design_matrix(self):
+        """
+        Returns matrix (n_pixels, n_components+1) on masked pixels, last column is background.
+        """
+        mask = self.m_mask.ravel()
+        columns = self.m_components.reshape(len(self.m_components), -1)[:, mask]
+        return np.vstack([columns, np.ones((1, columns.shape[1]))]).T
+
+    def fit(self):
+        """
+        Returns array of component scales, background is stored in m_background.
+        """
+        matrix = self.design_matrix()
+        target = self.m_exp_array.ravel()[self.m_mask.ravel()]
+        weighted_matrix, weighted_target = matrix, target
+        if self.m_poisson:
+            sigma = np.sqrt(np.maximum(target, 1.0))
+            weighted_matrix, weighted_target = matrix/sigma[:, np.newaxis], target/sigma
+
+        norms = np.linalg.norm(weighted_matrix, axis=0)
+        norms[norms == 0.0] = 1.0
+        solution = nnls(weighted_matrix/norms, weighted_target)[0]/norms
+
+        if self.m_log_space and np.any(solution > 0.0):
+            log_target = np.log10(np.maximum(target, 0.0) + 1.0)
+
+            def residuals(x):
+                return np.log10(np.maximum(matrix.dot(x), 0.0) + 1.0) - log_target
+
+            # the problem is solved for logarithms of parameters to keep them positive,
+            # zero parameters start from the value giving negligible contribution to the image
+            column_max = np.max(np.abs(matrix), axis=0)
+            floor = 1e-12*max(np.max(np.abs(target)), 1.0)/np.where(column_max > 0.0, column_max, 1.0)
+            x0 = np.log(np.maximum(solution, floor))
+            solution = np.exp(least_squares(lambda y: residuals(np.exp(y)), x0).x)
+
+        self.m_scales = solution[:-1]
+        self.m_background = solution[-1]
+        return self.m_scales
+
+    def model(self):
+        """
+        Returns fitted image, zero outside of the mask.
+        """
+        result = np.tensordot(self.m_scales, self.m_components, axes=1) + self.m_background
+        result[~self.m_mask] = 0.0
+        return result
+
+    def apply_to_configs(self, exp_config, sample_config):
+        """
+        Returns copies of configs with fitted scales and background.
+        Scales go to "layout_weight" (or "surface_filling_ratio") of the layout sections,
+        the scale of the layout without such settings (i.e. diffuse RandomSizeParticles)
+        goes to beam intensity, other layouts are rescaled relative to it. If that scale is zero,
+        the layout is removed from the sample and beam intensity is kept.
+        Only one layout without weight settings is supported.
+        """
+        exp_cfg, sample_cfg = copy.deepcopy(exp_config), copy.deepcopy(sample_config)
+        # config background is per full resolution pixel
+        exp_cfg["background"] = float(self.m_background)/exp_cfg.get("binning", 1)**2
+
+        def weight_key(name):
+            section = sample_cfg.get(name, {})
+            for key in ("layout_weight", "surface_filling_ratio"):
+                if key in section:
+                    return key
+            return None
+
+        free = [(name, scale) for name, scale in zip(self.m_names, self.m_scales) if weight_key(name) is None]
+        if len(free) > 1:
+            raise ValueError("Only one layout without 'layout_weight' or 'surface_filling_ratio' can be "
+                             "scaled, got {}".format(", ".join(name for name, _ in free)))
+        intensity_scale = 1.0
+        for name, scale in free:
+            if scale > 0.0:
+                intensity_scale = float(scale)
+            else:
+                sample_cfg["layouts"] = [layout for layout in sample_cfg["layouts"] if layout != name]
+        exp_cfg["beam_intensity"] = exp_config["beam_intensity"]*intensity_scale
+
+        for name, scale in zip(self.m_names, self.m_scales):
+            key = weight_key(name)
+            if key:
+                sample_cfg[name][key] = sample_cfg[name][key]*float(scale)/intensity_scale
+        return exp_cfg, sample_cfg
@@ -4,8 +4,12 @@ Collection of various utils for meso simulation.
 import os
 import json
 import sys
+import hashlib
+import numpy as np
 import numpy.random as npr
 
+_file_digests = dict()
+
 
 def load_setup(json_filename, config_name=None):
     """
@@ -30,3 +34,53 @@ def create_object(class_key, config):
 
 def random_gate(a, b):
     return a + (b-a)*npr.random()
+
+
+def config_digest(*configs):
+    """
+    Returns sha256 hex digest of canonical json representation of given configs.
+    Same configs give same digest regardless of the order of keys.
+    """
+    text = json.dumps(configs, sort_keys=True, separators=(',', ':'), default=lambda x: x.item())
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def file_digest(filename):
+    """
+    Returns sha256 hex digest of file content. Digest is calculated once per process.
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    key = (filename, stat.st_size, stat.st_mtime)
+    if key not in _file_digests:
+        sha = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _file_digests[key] = sha.hexdigest()
+    return _file_digests[key]
+
+
+def bin_samples(samples, widths):
+    """
+    Histograms samples (array N x D) onto regular grid with given bin widths along each
+    dimension (width 0 means no binning along this dimension).
+    Returns (centroids, counts, binned): centroids of occupied bins, number of samples in each bin,
+    and samples with every sample replaced by the centroid of its bin.
+    """
+    samples = np.asarray(samples, dtype=float)
+    widths = np.asarray(widths, dtype=float)
+    keys = np.where(widths > 0.0, np.floor(samples/np.where(widths > 0.0, widths, 1.0)), samples)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    sums = np.zeros((len(counts), samples.shape[1]))
+    np.add.at(sums, inverse, samples)
+    centroids = sums/counts[:, np.newaxis]
+    return centroids, counts, centroids[inverse]
+
+
+def wasserstein_1d(values, other_values):
+    """
+    Returns Wasserstein-1 (earth mover's) distance between two equally sized samples.
+    """
+    return float(np.mean(np.abs(np.sort(values) - np.sort(other_values))))
@@ -5,11 +5,14 @@ import math
 import bornagain as ba
 from bornagain import nm, deg
 import numpy as np
+from .distributions import lognormal_nodes, weighted_formfactor
 
 
 class MesoCrystalBuilder:
     """
     Meso crystal sample builder
+    The crystal (lattice, basis, particles) is built once, mesocrystals of the same size
+    are cloned from the prototype and only rotation is applied to every instance.
     """
     def __init__(self, config, particle_material):
         self.m_config = config
@@ -24,7 +27,8 @@ class MesoCrystalBuilder:
         self.particle_pos_sigma = config["particle_pos_sigma"]
         self.m_rotation_x = config["rotation_x"]
         self.m_rotation_z = config["rotation_z"]
-        pass
+        self.m_crystal = None
+        self.m_prototypes = dict()
 
     def create_lattice(self, length_a, length_c):
         result = ba.Lattice.createHexagonalLattice(length_a, length_c)
@@ -34,9 +38,16 @@ class MesoCrystalBuilder:
     def create_particle(self, material):
         return None
 
-    def create_outer_formfactor(self):
+    def create_outer_formfactor(self, meso_radius, meso_height):
         return None
 
+    @staticmethod
+    def basis_fractions():
+        """
+        Returns positions of particles in the unit cell in fractions of lattice basis vectors.
+        """
+        return [(0.0, 0.0, 0.0), (2.0/3.0, 1.0/3.0, 1.0/3.0), (1.0/3.0, 2.0/3.0, 2.0/3.0)]
+
     def create_basis(self, material, lattice):
         particle = self.create_particle(material)
 
@@ -44,40 +55,102 @@ class MesoCrystalBuilder:
         bas_b = lattice.getBasisVectorB()
         bas_c = lattice.getBasisVectorC()
 
-        position_0 = ba.kvector_t(0.0, 0.0, 0.0)
-        position_1 = 1.0/3.0*(2.0*bas_a + bas_b + bas_c)
-        position_2 = 1.0/3.0*(bas_a + 2.0*bas_b + 2.0*bas_c)
-        pos_vector = [position_0, position_1, position_2]
+        pos_vector = [fa*bas_a + fb*bas_b + fc*bas_c for fa, fb, fc in self.basis_fractions()]
         basis = ba.ParticleComposition()
         basis.addParticles(particle, pos_vector)
         return basis
 
-    def meso_area(self):
-        return np.pi * self.m_meso_radius * self.m_meso_radius
-
-    def create_meso(self):
-
-        lattice = self.create_lattice(self.m_lattice_length_a,
-                                      self.m_lattice_length_c)
-
-        basis = self.create_basis(self.particle_material, lattice)
-
-        ff_meso = self.create_outer_formfactor()
-
-        npc = ba.Crystal(basis, lattice)
-        npc.setPositionVariance(self.particle_pos_sigma*self.particle_pos_sigma)
-        result = ba.MesoCrystal(npc, ff_meso)
-
-        if self.m_rotation_z != 0.0:
-            rotZ = ba.RotationZ(self.m_rotation_z*deg)
+    def outer_symmetry_order(self):
+        """
+        Returns order of rotational symmetry of outer form factor around Z (0 for axisymmetric shapes).
+        """
+        return 1
+
+    def crystal_symmetry_order(self, tolerance=1e-6):
+        """
+        Returns highest order n of rotational symmetry of the crystal (lattice with basis) around Z,
+        i.e. crystal is invariant with respect to rotation by 360/n degrees.
+        """
+        lattice = self.create_lattice(self.m_lattice_length_a, self.m_lattice_length_c)
+        vectors = [lattice.getBasisVectorA(), lattice.getBasisVectorB(), lattice.getBasisVectorC()]
+        basis = np.array([[v.x(), v.y(), v.z()] for v in vectors]).T  # columns are basis vectors
+        fractions = np.array(self.basis_fractions())
+
+        for order in (6, 4, 3, 2):
+            angle = 2.0*np.pi/order
+            rot = np.array([[np.cos(angle), -np.sin(angle), 0.0],
+                            [np.sin(angle), np.cos(angle), 0.0],
+                            [0.0, 0.0, 1.0]])
+            # rotation in fractional coordinates, should be integer for lattice symmetry
+            frac_rot = np.linalg.solve(basis, rot.dot(basis))
+            if not np.allclose(frac_rot, np.round(frac_rot), atol=tolerance):
+                continue
+            rotated = fractions.dot(frac_rot.T)
+            diff = rotated[:, np.newaxis, :] - fractions[np.newaxis, :, :]
+            diff -= np.round(diff)
+            if np.all(np.any(np.all(np.abs(diff) < tolerance, axis=2), axis=1)):
+                return order
+        return 1
+
+    def phi_period(self):
+        """
+        Returns the period (deg) of rotation around Z, after which mesocrystal looks the same.
+        """
+        order = self.crystal_symmetry_order()
+        outer_order = self.outer_symmetry_order()
+        if outer_order != 0:
+            order = math.gcd(order, outer_order)
+        return 360.0/order
+
+    def meso_area(self, meso_radius=None):
+        meso_radius = self.m_meso_radius if meso_radius is None else meso_radius
+        return np.pi * meso_radius * meso_radius
+
+    def crystal(self):
+        """
+        Returns crystal made of lattice and basis, it is constructed only once.
+        """
+        if self.m_crystal is None:
+            lattice = self.create_lattice(self.m_lattice_length_a,
+                                          self.m_lattice_length_c)
+
+            basis = self.create_basis(self.particle_material, lattice)
+
+            self.m_crystal = ba.Crystal(basis, lattice)
+            self.m_crystal.setPositionVariance(self.particle_pos_sigma*self.particle_pos_sigma)
+        return self.m_crystal
+
+    def prototype(self, meso_radius, meso_height):
+        """
+        Returns non-rotated mesocrystal of given size, it is constructed once per size.
+        """
+        key = (meso_radius, meso_height)
+        if key not in self.m_prototypes:
+            ff_meso = self.create_outer_formfactor(meso_radius, meso_height)
+            self.m_prototypes[key] = ba.MesoCrystal(self.crystal(), ff_meso)
+        return self.m_prototypes[key]
+
+    def create_meso_instance(self, rotation_z, rotation_x, meso_radius=None, meso_height=None):
+        """
+        Returns clone of mesocrystal prototype with given rotation (deg) and size.
+        """
+        meso_radius = self.m_meso_radius if meso_radius is None else meso_radius
+        meso_height = self.m_meso_height if meso_height is None else meso_height
+        result = self.prototype(meso_radius, meso_height).clone()
+
+        if rotation_z != 0.0:
+            rotZ = ba.RotationZ(rotation_z*deg)
             result.setRotation(rotZ)
 
-        if self.m_rotation_x != 0.0:
-            rotX = ba.RotationX(self.m_rotation_x*deg)
+        if rotation_x != 0.0:
+            rotX = ba.RotationX(rotation_x*deg)
             result.rotate(rotX)
 
         return result
 
+    def create_meso(self):
+        return self.create_meso_instance(self.m_rotation_z, self.m_rotation_x)
+
 
 class FixedCylinder(MesoCrystalBuilder):
     """
@@ -89,22 +162,34 @@ class FixedCylinder(MesoCrystalBuilder):
     def create_particle(self, material):
         return ba.Particle(material, ba.FormFactorFullSphere(self.m_nanoparticle_radius))
 
-    def create_outer_formfactor(self):
-        return ba.FormFactorCylinder(self.m_meso_radius, self.m_meso_height)
+    def create_outer_formfactor(self, meso_radius, meso_height):
+        return ba.FormFactorCylinder(meso_radius, meso_height)
+
+    def outer_symmetry_order(self):
+        return 0
 
 
 class FuzzyCylinder(MesoCrystalBuilder):
     """
     Meso crystal sample builder
+    With "size_quadrature": "gauss_hermite" nanoparticle radii are nparticles Gauss-Hermite nodes
+    of the log-normal distribution instead of FormFactorSphereLogNormalRadius samples.
     """
     def __init__(self, config, particle_material):
         super().__init__(config, particle_material)
+        self.m_size_quadrature = config.get("size_quadrature", "uniform")
 
     def create_particle(self, material):
         scale_param = math.sqrt(math.log((self.m_sigma_nanoparticle_radius/self.m_nanoparticle_radius)**2 + 1.0))
+        if self.m_size_quadrature == "gauss_hermite":
+            radii, weights = lognormal_nodes(self.m_nanoparticle_radius, scale_param, self.m_nparticles)
+            return ba.Particle(material, weighted_formfactor(ba.FormFactorFullSphere, radii, weights))
         particle = ba.Particle(material, ba.FormFactorSphereLogNormalRadius(self.m_nanoparticle_radius, scale_param, self.m_nparticles))
         return particle
 
-    def create_outer_formfactor(self):
-        return ba.FormFactorCylinder(self.m_meso_radius, self.m_meso_height)
+    def create_outer_formfactor(self, meso_radius, meso_height):
+        return ba.FormFactorCylinder(meso_radius, meso_height)
+
+    def outer_symmetry_order(self):
+        return 0
 
@@ -5,8 +5,7 @@ import abc
 import bornagain as ba
 from core.create_mesocrystal_builder import create_mesocrystal_builder
 from .layout_factory_base import LayoutFactory
-from .meso_utils import random_gate
-import copy
+from .meso_utils import random_gate, bin_samples, wasserstein_1d
 import numpy as np
 import numpy.random as npr
 import random
@@ -48,6 +47,11 @@ class RotatedMesoFactory(MesoCrystalFactory):
     """
     Generates collection of 360 mesocrystals rotated around Z.
     External MesoCrystalBuilder is used to generate single mesocrystal.
+    With "fold_symmetry" on, phi values are folded into the irreducible wedge of the crystal
+    rotational symmetry, mesocrystals with coinciding orientations are merged into one
+    with the weight increased accordingly.
+    Optional "orientations" [[phi, tilt, weight], ...] (i.e. result of texture fit) replaces
+    the regular phi/tilt grid.
     """
     def __init__(self, config=None):
         super().__init__(config)
@@ -59,29 +63,59 @@ class RotatedMesoFactory(MesoCrystalFactory):
         self.m_tilt_steps = config["RotatedMesoFactory"]["tilt_steps"]
         self.m_layout_weight = config["RotatedMesoFactory"]["layout_weight"]
         self.m_filling_ratio = config["RotatedMesoFactory"]["surface_filling_ratio"]
+        self.m_fold_symmetry = config["RotatedMesoFactory"].get("fold_symmetry", False)
+        self.m_orientations = config["RotatedMesoFactory"].get("orientations")
 
-    def build_mesocrystals(self, material=None):
-        result = []
+    def orientations(self):
+        """
+        Returns list of (phi, tilt, weight) for all mesocrystals in the layout.
+        """
+        if self.m_orientations:
+            return [(phi, tilt, weight) for phi, tilt, weight in self.m_orientations]
 
+        result = []
         dphi = (self.m_phi_stop - self.m_phi_start)/self.m_phi_rotation_steps
         dtilt = (self.m_tilt_stop - self.m_tilt_start)/self.m_tilt_steps
-
-        total_meso_area = 0.0
         for i_tilt in range(0, int(self.m_tilt_steps)):
             tilt = self.m_tilt_start + i_tilt * dtilt
             for i_phi in range(0, int(self.m_phi_rotation_steps)):
                 phi = self.m_phi_start + i_phi*dphi
+                result.append((phi, tilt, 1.0))
+        return result
+
+    @staticmethod
+    def fold_orientations(orientations, phi_period, decimals=6):
+        """
+        Folds phi into [0, phi_period) and merges coinciding orientations by summing their weights.
+        Rotation around Z is applied before the tilt, so folding is valid for any tilt.
+        """
+        folded = dict()
+        for phi, tilt, weight in orientations:
+            key = (round(phi % phi_period, decimals) % phi_period, round(tilt, decimals))
+            folded[key] = folded.get(key, 0.0) + weight
+        return [(phi, tilt, weight) for (phi, tilt), weight in sorted(folded.items())]
+
+    def build_mesocrystals(self, material=None):
+        result = []
+
+        meso_builder = create_mesocrystal_builder(self.m_config, material)
 
-                cfg = copy.deepcopy(self.m_config)
-                cfg["rotation_z"] = phi
-                cfg["rotation_x"] = tilt
-                meso_builder = create_mesocrystal_builder(cfg, material)
+        orientations = self.orientations()
+        if self.m_fold_symmetry:
+            phi_period = meso_builder.phi_period()
+            folded = self.fold_orientations(orientations, phi_period)
+            print("RotatedMesoFactory > phi period {:.1f} deg, {} orientations folded into {}".format(
+                phi_period, len(orientations), len(folded)))
+            orientations = folded
 
-                mesocrystal = meso_builder.create_meso()
-                total_meso_area += meso_builder.meso_area()
-                result.append((mesocrystal, 1.0))
+        total_meso_area, total_weight = 0.0, 0.0
+        for phi, tilt, weight in orientations:
+            mesocrystal = meso_builder.create_meso_instance(phi, tilt)
+            total_meso_area += meso_builder.meso_area()*weight
+            total_weight += weight
+            result.append((mesocrystal, weight))
 
-        self.m_average_meso_area = total_meso_area/len(result)
+        self.m_average_meso_area = total_meso_area/total_weight
 
         return result
 
@@ -115,19 +149,31 @@ class SingleMesoFactory(MesoCrystalFactory):
 class RandomMesoFactory(MesoCrystalFactory):
     """
     Generates single mesocrystal using MesoCrystalBuilder
+    Optional "binning" {"phi": 0.1, "tilt": 0.05, "radius": 0.0, "height": 0.0} histograms
+    sampled (phi, tilt, radius, height) onto the grid with given bin widths (0 - no binning),
+    and generates single mesocrystal per occupied bin with the weight equal to number of samples.
+    Base phi values and their probabilities can be set with "phi_values" and "phi_weights".
     """
+    binning_keys = ("phi", "tilt", "radius", "height")
+
     def __init__(self, config=None):
         super().__init__(config)
         self.m_meso_count = config["RandomMesoFactory"]["meso_count"]
         self.m_layout_weight = config["RandomMesoFactory"]["layout_weight"]
         self.m_filling_ratio = config["RandomMesoFactory"]["surface_filling_ratio"]
         self.m_tilt_dtheta = config["RandomMesoFactory"]["tilt_dtheta"]
+        self.m_binning = config["RandomMesoFactory"].get("binning")
+        self.m_binning_error = dict()
         self.m_meso_radius = config["meso_radius"]
         self.m_meso_height = config["meso_height"]
-        self.m_phi_values = [0.0, 17.5, 29.0, 39.0, 58.5]
+        self.m_phi_values = config["RandomMesoFactory"].get("phi_values", [0.0, 17.5, 29.0, 39.0, 58.5])
+        self.m_phi_weights = config["RandomMesoFactory"].get("phi_weights")
 
     def generate_phi(self):
-        value = random.choice(self.m_phi_values)+random_gate(-0.25, 0.25)
+        if self.m_phi_weights:
+            value = random.choices(self.m_phi_values, self.m_phi_weights)[0]+random_gate(-0.25, 0.25)
+        else:
+            value = random.choice(self.m_phi_values)+random_gate(-0.25, 0.25)
         return value
 
     def generate_tilt(self):
@@ -139,32 +185,60 @@ class RandomMesoFactory(MesoCrystalFactory):
     def generate_height(self):
         return self.m_meso_height
 
+    def generate_samples(self):
+        """
+        Returns list of (phi, tilt, radius, height) for all mesocrystals.
+        """
+        return [(self.generate_phi(), self.generate_tilt(), self.generate_radius(), self.generate_height())
+                for i in range(0, self.m_meso_count)]
+
+    def bin_orientations(self, samples):
+        """
+        Histograms samples onto the grid, returns (samples, weights) with one sample per occupied bin.
+        Binning error is stored as Wasserstein-1 distance between binned and unbinned distributions
+        along every dimension.
+        """
+        widths = [self.m_binning.get(key, 0.0) for key in self.binning_keys]
+        centroids, counts, binned = bin_samples(samples, widths)
+        samples = np.asarray(samples, dtype=float)
+        self.m_binning_error = {key: wasserstein_1d(samples[:, i], binned[:, i])
+                                for i, key in enumerate(self.binning_keys)}
+        print("{} > {} mesocrystals binned into {}, binning error (W1): {}".format(
+            type(self).__name__, len(samples), len(centroids),
+            ", ".join("{}:{:.4f}".format(key, value) for key, value in self.m_binning_error.items())))
+        return [tuple(value) for value in centroids], [float(count) for count in counts]
+
+    def distinct_count(self):
+        """
+        Returns number of mesocrystals built by the factory, i.e. number of occupied bins if
+        binning is enabled (estimated on a fresh set of samples).
+        """
+        if not self.m_binning:
+            return self.m_meso_count
+        widths = [self.m_binning.get(key, 0.0) for key in self.binning_keys]
+        return len(bin_samples(self.generate_samples(), widths)[0])
+
     def build_mesocrystals(self, material):
         result = list()
 
-        total_meso_area = 0.0
-        for i in range(0, self.m_meso_count):
-            cfg = copy.deepcopy(self.m_config)
-
-            phi = self.generate_phi()
-            tilt = self.generate_tilt()
-            meso_radius = self.generate_radius()
-            meso_height = self.generate_height()
+        samples = self.generate_samples()
+        weights = [1.0]*len(samples)
+        if self.m_binning:
+            samples, weights = self.bin_orientations(samples)
 
-            print("phi:{:f} tilt:{:f} radius:{:f} height:{:f}".format(phi, tilt, meso_radius, meso_height))
-
-            cfg["rotation_z"] = phi
-            cfg["rotation_x"] = tilt
-            cfg["meso_radius"] = meso_radius
-            cfg["meso_height"] = meso_height
+        meso_builder = create_mesocrystal_builder(self.m_config, material)
 
-            meso_builder = create_mesocrystal_builder(cfg, material)
-            mesocrystal = meso_builder.create_meso()
-            total_meso_area += meso_builder.meso_area()
+        total_meso_area, total_weight = 0.0, 0.0
+        for (phi, tilt, meso_radius, meso_height), weight in zip(samples, weights):
+            mesocrystal = meso_builder.create_meso_instance(phi, tilt, meso_radius, meso_height)
+            total_meso_area += meso_builder.meso_area(meso_radius)*weight
+            total_weight += weight
 
-            result.append((mesocrystal, 1.0))
+            result.append((mesocrystal, weight))
 
-        self.m_average_meso_area = total_meso_area/len(result)
+        self.m_average_meso_area = total_meso_area/total_weight
+        print("{} > {} mesocrystals, {} distinct sizes".format(
+            type(self).__name__, len(result), len(meso_builder.m_prototypes)))
         return result
 
     def surface_density(self):
@@ -181,6 +255,9 @@ class LargeRandomMesoFactory(RandomMesoFactory):
         self.m_layout_weight = config["LargeRandomMesoFactory"]["layout_weight"]
         self.m_filling_ratio = config["LargeRandomMesoFactory"]["surface_filling_ratio"]
         self.m_tilt_dtheta = config["LargeRandomMesoFactory"]["tilt_dtheta"]
+        self.m_binning = config["LargeRandomMesoFactory"].get("binning")
+        self.m_phi_values = config["LargeRandomMesoFactory"].get("phi_values", self.m_phi_values)
+        self.m_phi_weights = config["LargeRandomMesoFactory"].get("phi_weights", self.m_phi_weights)
 
     def generate_radius(self):
         return 2000.0
@@ -199,6 +276,9 @@ class SmallRandomMesoFactory(RandomMesoFactory):
         self.m_layout_weight = config["SmallRandomMesoFactory"]["layout_weight"]
         self.m_filling_ratio = config["SmallRandomMesoFactory"]["surface_filling_ratio"]
         self.m_tilt_dtheta = config["SmallRandomMesoFactory"]["tilt_dtheta"]
+        self.m_binning = config["SmallRandomMesoFactory"].get("binning")
+        self.m_phi_values = config["SmallRandomMesoFactory"].get("phi_values", self.m_phi_values)
+        self.m_phi_weights = config["SmallRandomMesoFactory"].get("phi_weights", self.m_phi_weights)
 
     def generate_radius(self):
         return 200.0
@@ -0,0 +1,62 @@
+"""
+Collection of metrics to compare simulated intensity arrays with experimental data.
+"""
+import numpy as np
+
+
+def roi_mask(sim_array):
+    """
+    Returns mask of pixels which were actually simulated (outside of region of interest
+    and under masks simulated intensity is zero).
+    """
+    return np.asarray(sim_array) > 0.0
+
+
+def log_chi2(sim_array, exp_array, mask=None):
+    """
+    Returns mean squared difference of decimal logarithms of intensities.
+    """
+    sim_array, exp_array = np.asarray(sim_array), np.asarray(exp_array)
+    if mask is None:
+        mask = roi_mask(sim_array)
+    diff = np.log10(sim_array[mask]+1.0) - np.log10(np.maximum(exp_array[mask], 0.0)+1.0)
+    return float(np.mean(diff*diff)) if diff.size else 0.0
+
+
+def poisson_deviance(sim_array, exp_array, mask=None):
+    """
+    Returns mean Poisson deviance of experimental counts with respect to simulated intensities.
+    Works for single arrays and for stacks of simulated arrays (returns array of values then).
+    """
+    sim_array, exp_array = np.asarray(sim_array, dtype=float), np.asarray(exp_array, dtype=float)
+    if mask is None:
+        mask = roi_mask(sim_array if sim_array.ndim == 2 else sim_array[0])
+    mu = np.maximum(sim_array[..., mask], 1e-10)
+    n = np.maximum(exp_array[mask], 0.0)
+    term = np.where(n > 0.0, n*np.log(np.maximum(n, 1e-10)/mu), 0.0)
+    return np.mean(2.0*(term - (n - mu)), axis=-1) if n.size else 0.0
+
+
+def relative_l2(array, ref_array, mask=None):
+    """
+    Returns relative L2 norm of the difference between array and reference array.
+    """
+    array, ref_array = np.asarray(array), np.asarray(ref_array)
+    if mask is not None:
+        array, ref_array = array[mask], ref_array[mask]
+    norm = np.linalg.norm(ref_array)
+    return float(np.linalg.norm(array - ref_array)/norm) if norm > 0.0 else 0.0
+
+
+def scan_metrics(sim_array, exp_array):
+    """
+    Returns dictionary with summary metrics of single scan point.
+    """
+    sim_array = np.asarray(sim_array)
+    mask = roi_mask(sim_array)
+    return {
+        "log_chi2": log_chi2(sim_array, exp_array, mask),
+        "total_intensity": float(np.sum(sim_array)),
+        "max_intensity": float(np.max(sim_array)) if sim_array.size else 0.0,
+        "roi_pixels": int(np.count_nonzero(mask)),
+    }
@@ -0,0 +1,152 @@
+"""
+Library of detector images of single mesocrystal orientations.
+In decoupling approximation the image of the mesocrystal ensemble is the weighted sum
+of images of single orientations, so ensembles can be synthesized without re-simulation.
+"""
+import copy
+import json
+import numpy as np
+from .create_layout_factory import create_layout_factory
+
+
+def meso_layout_name(sample_config):
+    """
+    Returns the name of the first mesocrystal layout factory in the sample config.
+    """
+    for name in sample_config["layouts"]:
+        if "MesoFactory" in name:
+            return name
+    raise ValueError("Orientation library needs a mesocrystal layout (i.e. RotatedMesoFactory or "
+                     "RandomMesoFactory) in \"layouts\" of the sample config, got {}".format(sample_config["layouts"]))
+
+
+def meso_size(sample_config, layout_name):
+    """
+    Returns (meso_radius, meso_height) of mesocrystals of the layout. Random factories define
+    the size themselves (i.e. LargeRandomMesoFactory), others use top level config values.
+    """
+    factory = create_layout_factory(layout_name, sample_config)
+    if hasattr(factory, "generate_radius"):
+        radius, height = factory.generate_radius(), factory.generate_height()
+    else:
+        radius, height = sample_config["meso_radius"], sample_config["meso_height"]
+    if radius <= 0.0 or height <= 0.0:
+        raise ValueError("Mesocrystal size of {} is not defined (meso_radius {}, meso_height {})".format(
+            layout_name, radius, height))
+    return radius, height
+
+
+class OrientationLibrary:
+    """
+    Images of single mesocrystal (SingleMesoFactory) on the grid of (phi, tilt) nodes,
+    plus the image of all remaining layouts (i.e. diffuse scattering from free particles).
+    Images are simulated without constant background, it is added during synthesis.
+    """
+    def __init__(self, phi_values, tilt_values, images, base_image, background=0.0, phi_period=360.0):
+        self.m_phi_values = np.asarray(phi_values, dtype=float)
+        self.m_tilt_values = np.asarray(tilt_values, dtype=float)
+        self.m_images = np.asarray(images)  # shape (nphi, ntilt) + image shape
+        self.m_base_image = np.asarray(base_image)
+        self.m_background = background
+        self.m_phi_period = phi_period
+        self.m_roi_mask = np.any(self.m_images > 0.0, axis=(0, 1)) | (self.m_base_image > 0.0)
+
+    @staticmethod
+    def node_configs(exp_config, sample_config, phi_values, tilt_values):
+        """
+        Returns experimental config, sample configs of every (phi, tilt) node and
+        the config of remaining layouts (None, if there are no other layouts).
+        """
+        layout_name = meso_layout_name(sample_config)
+        meso_radius, meso_height = meso_size(sample_config, layout_name)
+        exp_cfg = copy.deepcopy(exp_config)
+        exp_cfg["background"] = 0.0
+
+        node_configs = []
+        for phi in phi_values:
+            for tilt in tilt_values:
+                cfg = copy.deepcopy(sample_config)
+                cfg["layouts"] = ["SingleMesoFactory"]
+                cfg["SingleMesoFactory"] = {
+                    "surface_filling_ratio": sample_config[layout_name]["surface_filling_ratio"]}
+                cfg["meso_radius"], cfg["meso_height"] = meso_radius, meso_height
+                cfg["rotation_z"] = float(phi)
+                cfg["rotation_x"] = float(tilt)
+                node_configs.append(cfg)
+
+        base_config = None
+        other_layouts = [name for name in sample_config["layouts"] if name != layout_name]
+        if other_layouts:
+            base_config = copy.deepcopy(sample_config)
+            base_config["layouts"] = other_layouts
+        return exp_cfg, node_configs, base_config
+
+    @classmethod
+    def build(cls, exp_config, sample_config, phi_values, tilt_values, executor, phi_period=360.0):
+        """
+        Simulates all nodes of the library using given ScanExecutor (i.e. in parallel workers).
+        """
+        exp_cfg, node_configs, base_config = cls.node_configs(exp_config, sample_config, phi_values, tilt_values)
+        executor.set_title("Orientation library")
+        for cfg in node_configs:
+            executor.add_point(exp_cfg, cfg)
+        if base_config:
+            executor.add_point(exp_cfg, base_config)
+
+        arrays = executor.results()
+        base_image = arrays.pop() if base_config else np.zeros_like(arrays[0])
+        images = np.array(arrays).reshape((len(phi_values), len(tilt_values)) + arrays[0].shape)
+        return cls(phi_values, tilt_values, images, base_image,
+                   exp_config.get("background", 200.0), phi_period)
+
+    def save(self, filename):
+        metadata = {"background": self.m_background, "phi_period": self.m_phi_period}
+        np.savez_compressed(filename, phi_values=self.m_phi_values, tilt_values=self.m_tilt_values,
+                            images=self.m_images, base_image=self.m_base_image,
+                            metadata=json.dumps(metadata))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            metadata = json.loads(str(data["metadata"]))
+            return cls(data["phi_values"], data["tilt_values"], data["images"], data["base_image"],
+                       metadata["background"], metadata["phi_period"])
+
+    def node_matrix(self):
+        """
+        Returns images as matrix (n_nodes, n_pixels), node index is phi_index*ntilt + tilt_index.
+        """
+        return self.m_images.reshape(self.m_images.shape[0]*self.m_images.shape[1], -1)
+
+    def grid_weights(self, orientations):
+        """
+        Distributes list of (phi, tilt, weight) over the library grid (nearest node),
+        phi is folded into the library period. Returns array of shape (nphi, ntilt).
+        """
+        orientations = np.asarray(orientations, dtype=float).reshape(-1, 3)
+        phi = orientations[:, 0] % self.m_phi_period
+        dphi = np.abs(phi[:, np.newaxis] - self.m_phi_values[np.newaxis, :])
+        dphi = np.minimum(dphi, self.m_phi_period - dphi)
+        i_phi = np.argmin(dphi, axis=1)
+        i_tilt = np.argmin(np.abs(orientations[:, 1, np.newaxis] - self.m_tilt_values[np.newaxis, :]), axis=1)
+        result = np.zeros((len(self.m_phi_values), len(self.m_tilt_values)))
+        np.add.at(result, (i_phi, i_tilt), orientations[:, 2])
+        return result
+
+    def pattern(self, weights, layout_weight=1.0, base_weight=1.0):
+        """
+        Returns ensemble image for given weights of grid nodes (array nphi x ntilt, normalized here),
+        layout_weight has the same meaning as in RotatedMesoFactory/RandomMesoFactory.
+        """
+        weights = np.asarray(weights, dtype=float)
+        weights = weights/np.sum(weights)
+        result = layout_weight*np.tensordot(weights, self.m_images, axes=([0, 1], [0, 1]))
+        result += base_weight*self.m_base_image
+        result[self.m_roi_mask] += self.m_background
+        return result
+
+    def orientation_pattern(self, orientations, layout_weight=1.0):
+        """
+        Returns ensemble image for list of (phi, tilt, weight).
+        """
+        return self.pattern(self.grid_weights(orientations), layout_weight)
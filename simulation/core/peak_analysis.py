@@ -0,0 +1,119 @@
+"""
+Peak analysis of the whole stack of intensity arrays at once.
+For every reference peak (xpeaks, ypeaks of exp_config) fixed window of pixels is cut from
+all images by a single fancy indexing operation, local background is subtracted and
+centroid, width and integrated intensity are computed within the peak ellipse.
+"""
+import csv
+import numpy as np
+from scipy import ndimage
+
+
+def find_peaks(array, pixel_centers, threshold=1e-3, size=9):
+    """
+    Returns list of (x, y) positions (mm) of local maxima of the image with intensity above
+    threshold*max, sorted by decreasing intensity (replacement of ba.FindPeaks).
+    """
+    array = np.asarray(array, dtype=float)
+    log_array = np.log10(np.maximum(array, 0.0) + 1.0)
+    maxima = (log_array == ndimage.maximum_filter(log_array, size=size)) & (array > threshold*np.max(array))
+    rows, cols = np.nonzero(maxima)
+    order = np.argsort(-array[rows, cols])
+    x, y = pixel_centers
+    return [(float(x[c]), float(y[r])) for r, c in zip(rows[order], cols[order])]
+
+
+class PeakAnalysis:
+    """
+    Extracts per peak metrics from the stack of images (n, ny, nx) cropped to the region of
+    interest of DetectorBuilder (as results and experimental data), or of the geometry given by
+    pixel_centers (x, y), i.e. bin centers of ResultSlicer with rows in result.array() order.
+    Ellipses around reference peaks have semi-axes radius and 2*radius (mm), as in DetectorBuilder.
+    """
+    columns = ("x", "y", "sigma_x", "sigma_y", "intensity", "background")
+
+    def __init__(self, detector_builder, radius=None, pixel_centers=None):
+        self.m_radius = detector_builder.peak_radius if radius is None else radius
+        self.m_xpeaks = np.asarray(detector_builder.m_xpeaks, dtype=float)
+        self.m_ypeaks = np.asarray(detector_builder.m_ypeaks, dtype=float)
+        x, y = detector_builder.pixel_centers() if pixel_centers is None else pixel_centers
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        self.m_shape = (len(y), len(x))
+        pixel = abs(x[1] - x[0]) if len(x) > 1 else detector_builder.pixel_size()
+
+        # window indices (npeaks, wy, wx) around nearest pixel to every reference peak
+        half_x = int(np.ceil(1.5*self.m_radius/pixel))
+        half_y = int(np.ceil(3.0*self.m_radius/pixel))
+        col0 = np.argmin(np.abs(x[np.newaxis, :] - self.m_xpeaks[:, np.newaxis]), axis=1)
+        row0 = np.argmin(np.abs(y[np.newaxis, :] - self.m_ypeaks[:, np.newaxis]), axis=1)
+        cols = col0[:, np.newaxis] + np.arange(-half_x, half_x+1)[np.newaxis, :]
+        rows = row0[:, np.newaxis] + np.arange(-half_y, half_y+1)[np.newaxis, :]
+        inside_x = (cols >= 0) & (cols < len(x))
+        inside_y = (rows >= 0) & (rows < len(y))
+        cols, rows = np.clip(cols, 0, len(x)-1), np.clip(rows, 0, len(y)-1)
+        self.m_rows = np.broadcast_to(rows[:, :, np.newaxis], (len(rows), rows.shape[1], cols.shape[1]))
+        self.m_cols = np.broadcast_to(cols[:, np.newaxis, :], self.m_rows.shape)
+        self.m_x = x[self.m_cols]
+        self.m_y = y[self.m_rows]
+
+        valid = inside_y[:, :, np.newaxis] & inside_x[:, np.newaxis, :]
+        ellipse = ((self.m_x - self.m_xpeaks[:, np.newaxis, np.newaxis])/self.m_radius)**2 + \
+                  ((self.m_y - self.m_ypeaks[:, np.newaxis, np.newaxis])/(2*self.m_radius))**2
+        self.m_peak_mask = valid & (ellipse <= 1.0)
+        self.m_ring_mask = valid & (ellipse > 1.0) & (ellipse <= 2.25)
+
+    def windows(self, stack):
+        """
+        Returns array (n, npeaks, wy, wx) of pixel windows around reference peaks.
+        """
+        stack = np.asarray(stack)
+        if stack.ndim == 2:
+            stack = stack[np.newaxis]
+        if stack.shape[1:] != self.m_shape:
+            raise ValueError("Image shape {} doesn't match analysis geometry {}".format(stack.shape[1:], self.m_shape))
+        return stack[:, self.m_rows, self.m_cols].astype(float)
+
+    def analyze(self, stack):
+        """
+        Returns dictionary column -> array (n, npeaks): centroid "x", "y" (mm), rms widths
+        "sigma_x", "sigma_y" (mm), background subtracted integrated "intensity" and
+        local "background" (mean intensity in elliptical ring around the peak).
+        """
+        windows = self.windows(stack)
+        ring_count = np.maximum(np.sum(self.m_ring_mask, axis=(1, 2)), 1)
+        background = np.sum(windows*self.m_ring_mask, axis=(2, 3))/ring_count
+        weights = np.maximum(windows - background[:, :, np.newaxis, np.newaxis], 0.0)*self.m_peak_mask
+        total = np.sum(weights, axis=(2, 3))
+        norm = np.where(total > 0.0, total, 1.0)
+
+        cx = np.sum(weights*self.m_x, axis=(2, 3))/norm
+        cy = np.sum(weights*self.m_y, axis=(2, 3))/norm
+        sx = np.sqrt(np.maximum(np.sum(weights*self.m_x**2, axis=(2, 3))/norm - cx*cx, 0.0))
+        sy = np.sqrt(np.maximum(np.sum(weights*self.m_y**2, axis=(2, 3))/norm - cy*cy, 0.0))
+        no_peak = total <= 0.0
+        return {"x": np.where(no_peak, np.nan, cx), "y": np.where(no_peak, np.nan, cy),
+                "sigma_x": np.where(no_peak, np.nan, sx), "sigma_y": np.where(no_peak, np.nan, sy),
+                "intensity": total, "background": background}
+
+    def offsets(self, result):
+        """
+        Returns distances (mm) of found centroids from the reference peaks, array (n, npeaks).
+        """
+        return np.hypot(result["x"] - self.m_xpeaks, result["y"] - self.m_ypeaks)
+
+    def write_table(self, filename, result, labels=None):
+        """
+        Writes tidy csv table with one row per (scan point, peak).
+        """
+        npoints = len(result["x"])
+        labels = list(range(npoints)) if labels is None else labels
+        offsets = self.offsets(result)
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("point", "peak", "x_ref", "y_ref") + self.columns + ("offset",))
+            for point in range(npoints):
+                for peak in range(len(self.m_xpeaks)):
+                    values = [result[name][point, peak] for name in self.columns]
+                    writer.writerow([labels[point], peak, self.m_xpeaks[peak], self.m_ypeaks[peak]] +
+                                    ["{:.6g}".format(value) for value in values] +
+                                    ["{:.6g}".format(offsets[point, peak])])
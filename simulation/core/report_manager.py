@@ -9,6 +9,8 @@ from pylatex.utils import NoEscape, bold, escape_latex
 from pylatex import SmallText, FootnoteText, HugeText, Figure
 from matplotlib import pyplot as plt
 import json
+from .figure_template import PngWriter
+from . import instrumentation
 
 
 def mono(s):
@@ -20,12 +22,14 @@ def tiny(s):
 
 
 class ReportManager:
-    def __init__(self, output_dir="../output", run_title="Experiment"):
+    def __init__(self, output_dir="../output", run_title="Experiment", png_workers=0, png_mode="thread"):
         self.m_title = run_title
         self.m_run_prefix = "run"
         self.m_comment = "none"
         self.m_output_dir = output_dir
         self.m_output_index = 1
+        self.m_png_writer = PngWriter(png_workers, png_mode)
+        self.m_figure_templates = dict()
 
         geometry_options = {"margin": "0.5in"}
         self.m_doc = pl.Document("run-summary", document_options="landscape",
@@ -39,10 +43,14 @@ class ReportManager:
             os.makedirs(dir_name)
 
     def prepare_output_dir(self):
+        """
+        Removes files of previous run. Subdirectories (i.e. scan store) are kept.
+        """
         self.make_dir(self.m_output_dir)
         files = glob.glob(self.m_output_dir+"/*")
         for f in files:
-            os.remove(f)
+            if os.path.isfile(f):
+                os.remove(f)
 
     def output_png(self):
         """
@@ -51,11 +59,19 @@ class ReportManager:
         return '{}/{}-{:03d}.png'.format(self.m_output_dir, self.m_run_prefix,
                                          self.m_output_index)
 
-    def write_report(self, json_config=None, slide_title=None):
+    def figure_template(self, name, template_type):
+        """
+        Returns figure template of given type, it is created once per report.
+        """
+        if name not in self.m_figure_templates:
+            self.m_figure_templates[name] = template_type()
+        return self.m_figure_templates[name]
+
+    def write_report(self, json_config=None, slide_title=None, figure=None):
         """
         Append single page to PDF report (in memory).
         The page will contain a table with current list of parameters, and single
-        image which is currently in pyplot.
+        image which is either given figure template or figure currently in pyplot.
         """
         doc = self.m_doc
         if slide_title:
@@ -67,7 +83,7 @@ class ReportManager:
         doc.append("\n")
         if json_config:
             self.create_json_minipage(json_config)
-        self.create_figure_minipage()
+        self.create_figure_minipage(figure)
         doc.append(pl.NewPage())
         self.m_output_index += 1
 
@@ -94,12 +110,16 @@ class ReportManager:
             str = json.dumps(json_config, sort_keys=False, indent=2, separators=(',', ': '))
             page.append(NoEscape(mono(tiny(escape_latex(str)))))
 
-    def create_figure_minipage(self):
+    def create_figure_minipage(self, figure=None):
         """
-        Create minipage with single figure which is currently in pyplot memory
+        Create minipage with given figure template or with figure which is currently in pyplot memory
         """
         doc = self.m_doc
-        plt.savefig(self.output_png())
+        with instrumentation.span("render_png"):
+            if figure:
+                self.m_png_writer.write(self.output_png(), figure.render())
+            else:
+                plt.savefig(self.output_png())
         with doc.create(pl.MiniPage(width=r"0.70\textwidth",
                                     height=r"0.25\textwidth",
                                     content_pos='t')) as page:
@@ -111,6 +131,8 @@ class ReportManager:
         """
         Write all pages in single pdf file.
         """
+        self.m_png_writer.wait()
         filepath = os.path.join(self.m_output_dir, self.m_run_prefix+"-summary")
-        self.m_doc.generate_pdf(clean_tex=False, filepath=filepath)
+        with instrumentation.span("latex"):
+            self.m_doc.generate_pdf(clean_tex=False, filepath=filepath)
 
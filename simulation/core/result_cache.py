@@ -0,0 +1,102 @@
+"""
+Persistent on-disk cache of simulation results.
+Results are addressed by the digest of experiment config, sample config and
+experimental data file, and stored as compressed numpy archives.
+"""
+import os
+import glob
+import json
+import time
+import numpy as np
+from .meso_utils import config_digest, file_digest
+
+default_cache_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache"))
+
+# increase when stored arrays change meaning (i.e. array layout or metadata)
+cache_version = 2
+
+_code_digest = None
+
+
+def code_digest():
+    """
+    Returns digest of all core/*.py files, so results of changed builders are not reused.
+    """
+    global _code_digest
+    if _code_digest is None:
+        filenames = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+        _code_digest = config_digest(cache_version, [(os.path.basename(name), file_digest(name)) for name in filenames])
+    return _code_digest
+
+
+class ResultCache:
+    """
+    Size bounded cache of simulated intensity arrays with least recently used eviction.
+    Every entry is a single .npz file, access time is tracked via file modification time,
+    so the cache can be shared by several worker processes.
+    Keys include cache_version and the digest of the builder code.
+    """
+    def __init__(self, cache_dir=default_cache_dir, max_size=2*1024**3):
+        self.m_cache_dir = cache_dir
+        self.m_max_size = max_size  # bytes
+
+    def key(self, exp_config, sample_config, data_file):
+        data_digest = file_digest(data_file) if os.path.exists(data_file) else data_file
+        return config_digest(exp_config, sample_config, data_digest, code_digest())
+
+    def entry_path(self, key):
+        return os.path.join(self.m_cache_dir, key+".npz")
+
+    def load(self, key):
+        """
+        Returns (array, metadata) for given key or (None, None) if nothing is cached yet.
+        """
+        filename = self.entry_path(key)
+        if not os.path.exists(filename):
+            return None, None
+        try:
+            with np.load(filename) as entry:
+                array = entry["array"]
+                metadata = json.loads(str(entry["metadata"]))
+        except (OSError, ValueError, KeyError):
+            return None, None
+        os.utime(filename)
+        return array, metadata
+
+    def save(self, key, array, metadata):
+        """
+        Stores intensity array together with axes metadata and evicts old entries if necessary.
+        """
+        if not os.path.exists(self.m_cache_dir):
+            os.makedirs(self.m_cache_dir, exist_ok=True)
+        metadata = dict(metadata, created=time.time())
+        filename = self.entry_path(key)
+        tmp_filename = "{}.{}.tmp.npz".format(filename[:-4], os.getpid())
+        np.savez_compressed(tmp_filename, array=array, metadata=json.dumps(metadata))
+        os.replace(tmp_filename, filename)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until total size fits into the limit.
+        """
+        entries = []
+        for name in os.listdir(self.m_cache_dir):
+            if not name.endswith(".npz") or name.endswith(".tmp.npz"):
+                continue
+            filename = os.path.join(self.m_cache_dir, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total_size <= self.m_max_size:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            total_size -= size
@@ -0,0 +1,85 @@
+"""
+Projections and slices of simulation results computed on numpy arrays.
+Every result is converted to histogram only once per axes units, projections are
+then array reductions instead of repeated conversions of the whole detector image.
+"""
+from collections import OrderedDict
+import numpy as np
+
+_slicers = OrderedDict()
+_max_slicers = 16
+
+
+class ResultSlicer:
+    """
+    Intensity array with bin boundaries of both axes. Rows of m_values go with ascending y.
+    """
+    def __init__(self, values, x_edges, y_edges):
+        self.m_values = np.asarray(values, dtype=float)
+        self.m_x_edges = np.asarray(x_edges, dtype=float)
+        self.m_y_edges = np.asarray(y_edges, dtype=float)
+        self.m_x_centers = 0.5*(self.m_x_edges[1:] + self.m_x_edges[:-1])
+        self.m_y_centers = 0.5*(self.m_y_edges[1:] + self.m_y_edges[:-1])
+
+    @classmethod
+    def from_histogram(cls, hist):
+        # IHistogram.array() has top row first
+        return cls(np.flipud(hist.array()), hist.getXaxis().getBinBoundaries(),
+                   hist.getYaxis().getBinBoundaries())
+
+    def x_range(self):
+        return self.m_x_edges[0], self.m_x_edges[-1]
+
+    def y_range(self):
+        return self.m_y_edges[0], self.m_y_edges[-1]
+
+    @staticmethod
+    def bin_range(edges, vmin, vmax):
+        """
+        Returns slice of bins containing vmin and vmax (inclusive), same as IHistogram.projection.
+        """
+        nbins = len(edges) - 1
+        first = int(np.clip(np.searchsorted(edges, vmin, side="right") - 1, 0, nbins-1))
+        last = int(np.clip(np.searchsorted(edges, vmax, side="right") - 1, 0, nbins-1))
+        return slice(first, last+1)
+
+    def projection_x(self, ymin=None, ymax=None):
+        """
+        Returns bin centers and intensities summed over y bins in [ymin, ymax] (all by default).
+        """
+        rows = slice(None) if ymin is None else self.bin_range(self.m_y_edges, ymin, ymax)
+        return self.m_x_centers, np.sum(self.m_values[rows, :], axis=0)
+
+    def projection_y(self, xmin=None, xmax=None):
+        """
+        Returns bin centers and intensities summed over x bins in [xmin, xmax] (all by default).
+        """
+        cols = slice(None) if xmin is None else self.bin_range(self.m_x_edges, xmin, xmax)
+        return self.m_y_centers, np.sum(self.m_values[:, cols], axis=1)
+
+    def projections_y(self, xmins, xmaxs):
+        """
+        Returns bin centers and array (n, ny) of projections for several x ranges at once,
+        computed from cumulative sums over x.
+        """
+        cumsum = np.concatenate([np.zeros((len(self.m_y_centers), 1)), np.cumsum(self.m_values, axis=1)], axis=1)
+        ranges = [self.bin_range(self.m_x_edges, xmin, xmax) for xmin, xmax in zip(xmins, xmaxs)]
+        first = np.array([r.start for r in ranges])
+        last = np.array([r.stop for r in ranges])
+        return self.m_y_centers, (cumsum[:, last] - cumsum[:, first]).T
+
+
+def slicer(result, units):
+    """
+    Returns ResultSlicer of SimulationResult in given units. Slicers of recently used results
+    are kept, so the conversion is done once per result and units.
+    """
+    key = (id(result), units)
+    if key in _slicers:
+        _slicers.move_to_end(key)
+        return _slicers[key][1]
+    # reference to the result is kept along with the slicer, so its id can't be reused
+    _slicers[key] = (result, ResultSlicer.from_histogram(result.histogram2d(units)))
+    if len(_slicers) > _max_slicers:
+        _slicers.popitem(last=False)
+    return _slicers[key][1]
@@ -5,6 +5,7 @@ Can work with arbitrary number of particle layouts.
 import bornagain as ba
 from bornagain import nm, angstrom
 from .create_layout_factory import create_layout_factory
+from . import instrumentation
 from periodictable.xsf import xray_energy, xray_sld_from_atoms, xray_sld
 from periodictable.xsf import index_of_refraction, mirror_reflectivity
 import periodictable as pt
@@ -58,7 +59,8 @@ class SampleBuilderVer3:
         """
         Constructs multilayer with collection of mesocrystals.
         """
-        self.init_materials(wavelength)
+        with instrumentation.span("materials"):
+            self.init_materials(wavelength)
 
         multi_layer = ba.MultiLayer()
         air_layer = ba.Layer(self.m_air_material)
@@ -66,7 +68,8 @@ class SampleBuilderVer3:
         substrate_layer = ba.Layer(self.m_substrate_material)
 
         for layout_factory in self.m_layouts:
-            avg_layer.addLayout(layout_factory.create_layout(self.m_particle_material))
+            with instrumentation.span("layout", layout=type(layout_factory).__name__):
+                avg_layer.addLayout(layout_factory.create_layout(self.m_particle_material))
 
         roughness = ba.LayerRoughness(self.m_roughness, 0.3, 500.0*nm)
         multi_layer.addLayer(air_layer)
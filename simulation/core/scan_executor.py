@@ -0,0 +1,187 @@
+"""
+Runs scan points in a pool of worker processes.
+Each worker builds its own SimulationBuilder, results are reported in scan order.
+"""
+import copy
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy.random as npr
+from .simulation_builder import SimulationBuilder
+from .metrics import scan_metrics
+from .cost_model import CostModel, ScanProgress
+from . import instrumentation
+
+
+def init_worker():
+    """
+    Reseeds random generators of freshly started worker. Otherwise all workers
+    would inherit the same random state from the parent process.
+    """
+    npr.seed()
+    random.seed()
+
+
+def simulate_point(exp_config, sample_config, threads=0, cache=None, index=None):
+    """
+    Runs single simulation and returns intensity array and simulation time.
+    Executed in worker process, so only numpy arrays travel back.
+    """
+    instrumentation.set_context(point=index)
+    with instrumentation.span("scan_point"):
+        builder = SimulationBuilder(exp_config, sample_config, threads, cache)
+        print(json.dumps(sample_config, sort_keys=True, indent=2, separators=(',', ': ')))
+        result = builder.run_simulation()
+        return result.array(), builder.m_time_spend
+
+
+class ScanPoint:
+    """
+    Single point of the scan: configs to simulate and the title of report slide.
+    """
+    def __init__(self, index, exp_config, sample_config, title, use_cache=True):
+        self.m_index = index
+        self.m_exp_config = copy.deepcopy(exp_config)
+        self.m_sample_config = copy.deepcopy(sample_config)
+        self.m_title = title
+        self.m_use_cache = use_cache
+
+
+class ScanExecutor:
+    """
+    Collects scan points and runs them either in current process (workers=1),
+    or in the pool of worker processes. Every worker runs BornAgain with given
+    number of threads (0 means all available cores).
+    Results are looked up in the given ResultCache first, if any.
+    Every finished point is saved immediately in the ScanStore, if any. When resuming,
+    points already present in the store are taken from there instead of being simulated.
+    Worker processes take points longest first according to the CostModel predictions.
+    """
+    def __init__(self, report_manager=None, workers=1, threads=0, cache=None, store=None, resume=False,
+                 cost_model=None):
+        self.m_report_manager = report_manager
+        self.m_workers = workers
+        self.m_threads = threads
+        self.m_cache = cache
+        self.m_store = store
+        self.m_resume = resume
+        self.m_cost_model = cost_model if cost_model else CostModel()
+        self.m_title = "Experiment"
+        self.m_points = []
+
+    def set_title(self, title):
+        """
+        Sets the title of report slides for all points added afterwards.
+        """
+        self.m_title = title
+
+    def add_point(self, exp_config, sample_config, use_cache=True):
+        """
+        Adds point to the scan. Configs are copied, so caller can continue to modify them.
+        Points with use_cache=False are always simulated anew (i.e. to check RNG stability).
+        """
+        self.m_points.append(ScanPoint(len(self.m_points), exp_config, sample_config,
+                                       self.m_title, use_cache))
+
+    def point_cache(self, point):
+        return self.m_cache if point.m_use_cache else None
+
+    def completed(self, points):
+        """
+        Runs simulation of given points, yields (point, array, time_spend) in order of completion.
+        """
+        costs = {point.m_index: self.m_cost_model.predict(point.m_exp_config, point.m_sample_config)
+                 for point in points}
+        progress = ScanProgress(costs, self.m_workers)
+        if points:
+            print("Scan of {} points, estimated time {:.0f} sec".format(len(points), progress.eta()))
+
+        if self.m_workers <= 1:
+            for point in points:
+                array, time_spend = simulate_point(point.m_exp_config, point.m_sample_config,
+                                                   self.m_threads, self.point_cache(point), point.m_index)
+                progress.done(point.m_index, time_spend)
+                print("Scan point {} done in {:.1f} sec, {}".format(point.m_index+1, time_spend, progress.message()))
+                yield point, array, time_spend
+            return
+
+        with ProcessPoolExecutor(max_workers=self.m_workers, initializer=init_worker) as pool:
+            futures = dict()
+            # pool takes submitted points in order, so longest first submission packs workers evenly
+            for point in sorted(points, key=lambda p: -costs[p.m_index]):
+                future = pool.submit(simulate_point, point.m_exp_config, point.m_sample_config,
+                                     self.m_threads, self.point_cache(point), point.m_index)
+                futures[future] = point
+
+            for future in as_completed(futures):
+                point = futures[future]
+                array, time_spend = future.result()
+                progress.done(point.m_index, time_spend)
+                print("Scan point {} done in {:.1f} sec, {}".format(point.m_index+1, time_spend, progress.message()))
+                yield point, array, time_spend
+
+    def resumed(self, points):
+        """
+        Returns dictionary index -> (point, array, time_spend) of points already present in the store.
+        """
+        result = dict()
+        if not self.m_store or not self.m_resume:
+            return result
+        records = self.m_store.records()
+        for point in points:
+            record = self.m_store.find(point.m_index, point.m_exp_config, point.m_sample_config, records)
+            if record:
+                result[point.m_index] = (point, self.m_store.load_array(record), record["time_spend"])
+        print("Resuming scan: {} of {} points are taken from the store".format(len(result), len(points)))
+        return result
+
+    def store_point(self, point, array, time_spend):
+        if not self.m_store:
+            return
+        builder = SimulationBuilder(point.m_exp_config, point.m_sample_config)
+        metrics = scan_metrics(array, builder.experimentalData().array())
+        self.m_store.append(point.m_index, point.m_exp_config, point.m_sample_config,
+                            array, time_spend, metrics, point.m_title)
+
+    def simulate(self, points):
+        """
+        Runs simulation of given points, yields (point, array, time_spend) in scan order.
+        """
+        finished = self.resumed(points)
+        pending = [point for point in points if point.m_index not in finished]
+
+        next_index = 0
+        for point, array, time_spend in self.completed(pending):
+            self.store_point(point, array, time_spend)
+            finished[point.m_index] = (point, array, time_spend)
+            while next_index < len(points) and points[next_index].m_index in finished:
+                yield finished.pop(points[next_index].m_index)
+                next_index += 1
+
+        for point in points[next_index:]:
+            yield finished.pop(point.m_index)
+
+    def results(self):
+        """
+        Runs all points of the scan, returns list of intensity arrays in scan order.
+        """
+        result = [array for point, array, time_spend in self.simulate(self.m_points)]
+        self.m_points = []
+        return result
+
+    def run(self, report_func):
+        """
+        Runs all points of the scan. For every point in scan order calls
+        report_func(builder, result, sample_config, report_manager) in the current process.
+        """
+        for point, array, time_spend in self.simulate(self.m_points):
+            instrumentation.set_context(point=point.m_index)
+            with instrumentation.span("report_point"):
+                builder = SimulationBuilder(point.m_exp_config, point.m_sample_config)
+                builder.m_time_spend = time_spend
+                result = builder.convert_data(array)
+                if self.m_report_manager:
+                    self.m_report_manager.m_title = point.m_title
+                report_func(builder, result, point.m_sample_config, self.m_report_manager)
+        instrumentation.set_context(point=None)
+        self.m_points = []
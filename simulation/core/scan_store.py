@@ -0,0 +1,100 @@
+"""
+Append-only storage of scan results.
+Every finished scan point is written as soon as it completes: intensity array goes to
+its own .npz file, configs, timing and metrics are appended to the manifest.
+"""
+import os
+import json
+import time
+import numpy as np
+from .meso_utils import config_digest
+
+
+class ScanStore:
+    """
+    Directory with manifest.jsonl (one json record per finished point) and point-NNN.npz files.
+    """
+    def __init__(self, store_dir):
+        self.m_store_dir = store_dir
+        self.m_manifest = os.path.join(store_dir, "manifest.jsonl")
+
+    @staticmethod
+    def point_digest(exp_config, sample_config):
+        return config_digest(exp_config, sample_config)
+
+    def clear(self):
+        """
+        Removes all stored points.
+        """
+        if not os.path.exists(self.m_store_dir):
+            return
+        for name in os.listdir(self.m_store_dir):
+            if name == "manifest.jsonl" or name.endswith(".npz"):
+                os.remove(os.path.join(self.m_store_dir, name))
+
+    def append(self, index, exp_config, sample_config, array, time_spend, metrics=None, title=None):
+        """
+        Stores result of single scan point.
+        """
+        os.makedirs(self.m_store_dir, exist_ok=True)
+        digest = self.point_digest(exp_config, sample_config)
+        filename = "point-{:03d}-{}.npz".format(index, digest[:12])
+        tmp_filename = os.path.join(self.m_store_dir, filename[:-4]+".tmp.npz")
+        np.savez_compressed(tmp_filename, array=array)
+        os.replace(tmp_filename, os.path.join(self.m_store_dir, filename))
+
+        record = {
+            "index": index,
+            "digest": digest,
+            "title": title,
+            "file": filename,
+            "time_spend": time_spend,
+            "finished": time.time(),
+            "metrics": metrics if metrics else {},
+            "exp_config": exp_config,
+            "sample_config": sample_config,
+        }
+        with open(self.m_manifest, "a") as f:
+            f.write(json.dumps(record, default=lambda x: x.item())+"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return record
+
+    def records(self):
+        """
+        Returns dictionary index -> record, later records overwrite earlier ones.
+        Incomplete last line (i.e. after the crash) is ignored.
+        """
+        return {record["index"]: record for record in self.all_records()}
+
+    def all_records(self):
+        """
+        Returns list of all records with existing array files, including points of earlier scans
+        overwritten by the points with the same index.
+        """
+        result = []
+        if not os.path.exists(self.m_manifest):
+            return result
+        with open(self.m_manifest) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if os.path.exists(os.path.join(self.m_store_dir, record["file"])):
+                    result.append(record)
+        return result
+
+    def find(self, index, exp_config, sample_config, records=None):
+        """
+        Returns record of finished point with given index and same configs, or None.
+        """
+        records = self.records() if records is None else records
+        record = records.get(index)
+        if record and record["digest"] == self.point_digest(exp_config, sample_config):
+            return record
+        return None
+
+    def load_array(self, record):
+        with np.load(os.path.join(self.m_store_dir, record["file"])) as entry:
+            return entry["array"]
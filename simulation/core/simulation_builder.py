@@ -6,40 +6,61 @@ import bornagain as ba
 from bornagain import deg, nm, angstrom
 from .detector_builder import DetectorBuilder
 from .create_sample_builder import create_sample_builder
+from .meso_utils import config_digest
+from .instrument_model import InstrumentModel, raw_config
+from . import experimental_data
+from . import instrumentation
 
 
 class SimulationBuilder:
-    def __init__(self, exp_config, sample_config):
+    def __init__(self, exp_config, sample_config, threads=0, cache=None):
+        self.m_exp_config = exp_config
+        self.m_sample_config = sample_config
         self.m_beam_intensity = exp_config["beam_intensity"]
         self.m_beam_wavelength = exp_config["beam_wavelength"]*nm
         self.m_inclination_angle = exp_config["inclination_angle"]
         self.m_integration = exp_config["integration"]
+        self.m_mc_points = exp_config.get("mc_points", 50)
         self.m_resolution_sigma_factor = exp_config["det_sigma_factor"]
+        self.m_threads = threads  # 0 means BornAgain default (all cores)
         self.m_time_spend = 0
         self.m_sample_builder = create_sample_builder(sample_config)
         self.m_experimental_data = None
+        self.m_data_file = experimental_data.data_path(exp_config.get("data_file", "004_230_P144_im_full.int.gz"))
         self.m_detector_builder = DetectorBuilder(exp_config)
+        # background is given per full resolution pixel, binned pixel collects binning^2 of them
+        self.m_background = exp_config.get("background", 200.0)*self.m_detector_builder.binning()**2
+        self.m_cache = cache  # ResultCache or None
+        # raw mode: simulation without resolution, background and with unit beam intensity,
+        # instrument is applied afterwards by InstrumentModel
+        self.m_raw_mode = exp_config.get("raw_mode", False)
+        self.m_instrument_model = InstrumentModel(exp_config, self.m_detector_builder)
 
     def detector_resolution_sigma(self):
-        return self.m_detector_builder.pixel_size()*self.m_resolution_sigma_factor
+        return self.m_detector_builder.base_pixel_size()*self.m_resolution_sigma_factor
 
-    def build_simulation(self):
+    def create_simulation(self, raw=False):
+        """
+        Returns simulation with beam, detector and options set, but without the sample.
+        Raw simulation has unit beam intensity, no background and no detector resolution.
+        """
         result = ba.GISASSimulation()
         result.setTerminalProgressMonitor()
-        result.getOptions().setMonteCarloIntegration(self.m_integration, 50)
+        result.getOptions().setMonteCarloIntegration(self.m_integration, self.m_mc_points)
+        if self.m_threads > 0:
+            result.getOptions().setNumberOfThreads(self.m_threads)
 
         result.setDetector(self.m_detector_builder.create_detector())
         result.setBeamParameters(self.m_beam_wavelength, self.m_inclination_angle*deg, 0.0)
-        result.setBeamIntensity(self.m_beam_intensity)
-        result.setSample(self.m_sample_builder.build_sample(self.m_beam_wavelength))
-        result.setRegionOfInterest(30.0, 21.0, 65.0, 58.0)  # basic
-        # result.setRegionOfInterest(30.0, 21.0, 50.0, 43.0)  # smaller
-        # result.setRegionOfInterest(41.0, 26.0, 47.0, 34.0)  # singlepeak
+        result.setBeamIntensity(1.0 if raw else self.m_beam_intensity)
+        result.setRegionOfInterest(*self.m_detector_builder.region_of_interest())
         result.getOptions().setUseAvgMaterials(True)
         # result.setBackground(ba.PoissonNoiseBackground())
-        result.setBackground(ba.ConstantBackground(200.0))
+        if self.m_background > 0.0 and not raw:
+            result.setBackground(ba.ConstantBackground(self.m_background))
 
-        result.setDetectorResolutionFunction(ba.ResolutionFunction2DGaussian(self.detector_resolution_sigma(), self.detector_resolution_sigma()*1.7))
+        if not raw:
+            result.setDetectorResolutionFunction(ba.ResolutionFunction2DGaussian(self.detector_resolution_sigma(), self.detector_resolution_sigma()*1.7))
 
         self.m_detector_builder.apply_masks(result)
 
@@ -49,22 +70,73 @@ class SimulationBuilder:
         # alpha_distr = ba.DistributionGaussian(self.m_inclination_angle*deg, self.m_inclination_angle*deg/20.)
         # result.addParameterDistribution("*/Beam/InclinationAngle", alpha_distr, 10)
 
-        data = ba.IHistogram.createFrom("../data/004_230_P144_im_full.int.gz").array()
-        self.m_experimental_data = ba.ConvertData(result, data)
+        return result
 
+    def build_simulation(self, raw=False):
+        result = self.create_simulation(raw)
+        with instrumentation.span("build_sample"):
+            result.setSample(self.m_sample_builder.build_sample(self.m_beam_wavelength))
         return result
 
     def run_simulation(self):
-        simulation = self.build_simulation()
+        if self.m_raw_mode:
+            return self.convert_data(self.m_instrument_model.apply(self.raw_array()))
+        return self.simulate(self.m_exp_config)
+
+    def raw_array(self):
+        """
+        Returns raw intensity array (unit beam intensity, no background, no resolution).
+        Cached raw arrays are shared by all values of instrument parameters.
+        """
+        return self.simulate(raw_config(self.m_exp_config), raw=True).array()
+
+    def simulate(self, key_config, raw=False):
+        """
+        Runs simulation or takes its result from the cache, key_config is experimental config
+        used in the cache key.
+        """
+        key = None
+        if self.m_cache:
+            key = self.m_cache.key(key_config, self.m_sample_config, self.m_data_file)
+            array, metadata = self.m_cache.load(key)
+            if array is not None:
+                self.m_time_spend = 0
+                print("Result is taken from cache '{}'".format(key))
+                return self.convert_data(array)
+
+        simulation = self.build_simulation(raw)
         start = time.time()
         print("Starting")
-        simulation.runSimulation()
+        with instrumentation.span("run_simulation"):
+            simulation.runSimulation()
         self.m_time_spend = time.time() - start
         print("\nDone in {:0} sec".format(self.m_time_spend))
-        return simulation.result()
+        result = simulation.result()
+
+        if self.m_cache:
+            array = result.array()
+            metadata = self.m_detector_builder.axes_metadata()
+            metadata["shape"] = list(array.shape)
+            metadata["time_spend"] = self.m_time_spend
+            self.m_cache.save(key, array, metadata)
+        return result
+
+    def convert_data(self, data):
+        """
+        Returns numpy array (i.e. obtained from another process) as SimulationResult
+        in same units as simulated data.
+        """
+        return ba.ConvertData(self.create_simulation(), data)
 
     def experimentalData(self):
         """
         Returns experimental data in same units as simulated data.
         """
+        if self.m_experimental_data is None:
+            with instrumentation.span("experimental_data"):
+                # beam intensity, background or resolution don't change converted data
+                geometry_key = config_digest(self.m_detector_builder.geometry(), self.m_beam_wavelength,
+                                             self.m_inclination_angle)
+                self.m_experimental_data = experimental_data.converted_data(
+                    self.m_data_file, geometry_key, self.create_simulation, self.m_detector_builder.binning())
         return self.m_experimental_data
@@ -0,0 +1,235 @@
+"""
+Surrogate model (Bayesian) optimization for expensive simulations.
+Gaussian process is fitted to all known (parameters, objective) pairs, including results
+of earlier runs found in scan stores. New points are proposed in batches by expected
+improvement with constant liar, so several workers are kept busy.
+"""
+import copy
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from scipy.stats import norm
+from .fitting import create_objective, get_config_value, set_config_value
+from .meso_utils import config_digest
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression with squared exponential kernel with individual length
+    scale for every input (inputs are expected to be scaled to unit cube). Targets are
+    standardized, hyperparameters are found by maximizing log marginal likelihood.
+    """
+    def __init__(self, ndim):
+        self.m_log_length_scales = np.log(np.full(ndim, 0.3))
+        self.m_log_noise = np.log(1e-4)
+        self.m_x = None
+        self.m_y = None
+        self.m_y_mean = 0.0
+        self.m_y_std = 1.0
+        self.m_factor = None
+        self.m_alpha = None
+
+    def kernel(self, a, b, log_length_scales):
+        d = (a[:, np.newaxis, :] - b[np.newaxis, :, :])/np.exp(log_length_scales)
+        return np.exp(-0.5*np.sum(d*d, axis=2))
+
+    def neg_log_likelihood(self, params, x, y):
+        log_length_scales, log_noise = params[:-1], params[-1]
+        matrix = self.kernel(x, x, log_length_scales) + (np.exp(log_noise) + 1e-10)*np.eye(len(x))
+        try:
+            factor = cho_factor(matrix, lower=True)
+        except np.linalg.LinAlgError:
+            return 1e10
+        alpha = cho_solve(factor, y)
+        return 0.5*y.dot(alpha) + np.sum(np.log(np.diag(factor[0])))
+
+    def fit(self, x, y, optimize=True):
+        """
+        Fits the model to points x (n, ndim) with values y (n), hyperparameters are
+        kept from the previous fit when optimize=False.
+        """
+        self.m_x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.m_y_mean, self.m_y_std = np.mean(y), max(np.std(y), 1e-12)
+        self.m_y = (y - self.m_y_mean)/self.m_y_std
+
+        if optimize and len(y) > 2:
+            bounds = [(np.log(1e-2), np.log(10.0))]*self.m_x.shape[1] + [(np.log(1e-8), np.log(1.0))]
+            best = None
+            for start in (0.1, 0.3, 1.0):
+                x0 = np.append(np.full(self.m_x.shape[1], np.log(start)), self.m_log_noise)
+                result = minimize(self.neg_log_likelihood, x0, args=(self.m_x, self.m_y),
+                                  method="L-BFGS-B", bounds=bounds)
+                if best is None or result.fun < best.fun:
+                    best = result
+            self.m_log_length_scales, self.m_log_noise = best.x[:-1], best.x[-1]
+
+        matrix = self.kernel(self.m_x, self.m_x, self.m_log_length_scales)
+        matrix += (np.exp(self.m_log_noise) + 1e-10)*np.eye(len(self.m_x))
+        self.m_factor = cho_factor(matrix, lower=True)
+        self.m_alpha = cho_solve(self.m_factor, self.m_y)
+
+    def predict(self, x):
+        """
+        Returns predicted mean and standard deviation at points x (n, ndim).
+        """
+        k = self.kernel(np.atleast_2d(x), self.m_x, self.m_log_length_scales)
+        mean = k.dot(self.m_alpha)
+        variance = 1.0 - np.sum(k*cho_solve(self.m_factor, k.T).T, axis=1)
+        std = np.sqrt(np.maximum(variance, 1e-12))
+        return self.m_y_mean + self.m_y_std*mean, self.m_y_std*std
+
+
+def expected_improvement(mean, std, best):
+    """
+    Returns expected improvement over the best (minimal) value.
+    """
+    z = (best - mean)/std
+    return (best - mean)*norm.cdf(z) + std*norm.pdf(z)
+
+
+class BayesOptimizer:
+    """
+    Minimizes objective over free sample config keys (same fit config as for Fitter) using
+    Gaussian process surrogate. Past results of the same experiment and sample (up to the free
+    parameters) are taken from given scan stores, new points are simulated by ScanExecutor
+    (its store keeps them for the next runs). Stops when expected improvement falls below
+    ei_tolerance times the best value.
+    """
+    def __init__(self, exp_config, sample_config, fit_config, executor, stores=()):
+        self.m_exp_config = exp_config
+        self.m_sample_config = sample_config
+        self.m_executor = executor
+        self.m_stores = stores
+        self.m_names = [par["name"] for par in fit_config["parameters"]]
+        self.m_lower = np.array([par["min"] for par in fit_config["parameters"]], dtype=float)
+        self.m_upper = np.array([par["max"] for par in fit_config["parameters"]], dtype=float)
+        self.m_initial_points = fit_config.get("initial_points", 2*len(self.m_names) + 2)
+        self.m_batch = fit_config.get("batch", max(executor.m_workers, 1))
+        self.m_iterations = fit_config.get("iterations", 20)
+        self.m_ei_tolerance = fit_config.get("ei_tolerance", 1e-3)
+        self.m_rng = np.random.RandomState(fit_config.get("seed", 1))
+        self.m_objective = create_objective(exp_config, sample_config, fit_config)
+        self.m_gp = GaussianProcess(len(self.m_names))
+        self.m_x = np.empty((0, len(self.m_names)))
+        self.m_y = np.empty(0)
+        self.m_trace = []
+
+    def to_unit(self, x):
+        return (np.asarray(x) - self.m_lower)/(self.m_upper - self.m_lower)
+
+    def from_unit(self, u):
+        return self.m_lower + np.asarray(u)*(self.m_upper - self.m_lower)
+
+    def candidate_config(self, x):
+        result = copy.deepcopy(self.m_sample_config)
+        for name, value in zip(self.m_names, x):
+            set_config_value(result, name, float(value))
+        return result
+
+    def fixed_digest(self, sample_config):
+        """
+        Returns digest of sample config with free parameters removed.
+        """
+        cfg = copy.deepcopy(sample_config)
+        for name in self.m_names:
+            set_config_value(cfg, name, None)
+        return config_digest(cfg)
+
+    def load_known_points(self):
+        """
+        Collects results from the stores matching the experiment and fixed part of the sample.
+        """
+        exp_digest = config_digest(self.m_exp_config)
+        sample_digest = self.fixed_digest(self.m_sample_config)
+        known = dict()
+        for store in self.m_stores:
+            for record in store.all_records():
+                try:
+                    if config_digest(record["exp_config"]) != exp_digest or \
+                            self.fixed_digest(record["sample_config"]) != sample_digest:
+                        continue
+                    x = [float(get_config_value(record["sample_config"], name)) for name in self.m_names]
+                except (KeyError, TypeError):
+                    continue
+                if np.all(np.asarray(x) >= self.m_lower) and np.all(np.asarray(x) <= self.m_upper):
+                    known[record["digest"]] = (x, store, record)
+
+        if known:
+            points = list(known.values())
+            values = self.m_objective([store.load_array(record) for _, store, record in points])
+            self.add_points([x for x, _, _ in points], values)
+        print("BayesOptimizer > {} known points are taken from the stores".format(len(known)))
+
+    def add_points(self, x, values):
+        self.m_x = np.vstack([self.m_x, np.asarray(x, dtype=float).reshape(-1, len(self.m_names))])
+        self.m_y = np.concatenate([self.m_y, np.asarray(values, dtype=float)])
+
+    def evaluate(self, x, title):
+        self.m_executor.set_title(title)
+        for point in x:
+            self.m_executor.add_point(self.m_exp_config, self.candidate_config(point))
+        self.add_points(x, self.m_objective(self.m_executor.results()))
+
+    def maximize_ei(self, best, nsamples=2048, nrefine=4):
+        """
+        Returns (unit cube point, expected improvement) maximizing expected improvement of current model.
+        """
+        u = self.m_rng.random_sample((nsamples, len(self.m_names)))
+        ei = expected_improvement(*self.m_gp.predict(u), best)
+
+        def neg_ei(point):
+            return -expected_improvement(*self.m_gp.predict(point[np.newaxis, :]), best)[0]
+
+        result_u, result_ei = u[np.argmax(ei)], np.max(ei)
+        for start in u[np.argsort(ei)[-nrefine:]]:
+            refined = minimize(neg_ei, start, method="L-BFGS-B", bounds=[(0.0, 1.0)]*len(self.m_names))
+            if -refined.fun > result_ei:
+                result_u, result_ei = refined.x, -refined.fun
+        return result_u, result_ei
+
+    def propose_batch(self):
+        """
+        Returns batch of new points and expected improvement of the first one. Every next point
+        is proposed after adding the previous one with the best observed value (constant liar).
+        """
+        best = np.min(self.m_y)
+        x, y = self.to_unit(self.m_x), self.m_y
+        self.m_gp.fit(x, y)
+        batch, first_ei = [], None
+        for _ in range(self.m_batch):
+            point, ei = self.maximize_ei(best)
+            first_ei = ei if first_ei is None else first_ei
+            batch.append(point)
+            x, y = np.vstack([x, point]), np.append(y, best)
+            self.m_gp.fit(x, y, optimize=False)
+        return self.from_unit(np.array(batch)), first_ei
+
+    def best(self):
+        index = int(np.argmin(self.m_y))
+        return float(self.m_y[index]), dict(zip(self.m_names, self.m_x[index].tolist()))
+
+    def run(self):
+        """
+        Runs optimization, returns (value, parameters) of the best point.
+        """
+        self.load_known_points()
+        missing = self.m_initial_points - len(self.m_y)
+        if missing > 0:
+            n = missing
+            strata = (np.argsort(self.m_rng.random_sample((n, len(self.m_names))), axis=0) +
+                      self.m_rng.random_sample((n, len(self.m_names))))/n
+            self.evaluate(self.from_unit(strata), "Bayesian optimization, initial points")
+
+        for iteration in range(self.m_iterations):
+            batch, ei = self.propose_batch()
+            value, parameters = self.best()
+            self.m_trace.append({"iteration": iteration, "points": len(self.m_y), "best": value,
+                                 "expected_improvement": float(ei), "parameters": parameters})
+            print("BayesOptimizer > iteration:{} points:{} best:{:.5f} EI:{:.2e} {}".format(
+                iteration, len(self.m_y), value, ei, parameters))
+            if ei < self.m_ei_tolerance*abs(value):
+                print("BayesOptimizer > expected improvement is below tolerance, stopping")
+                break
+            self.evaluate(batch, "Bayesian optimization, iteration {}".format(iteration))
+        return self.best()
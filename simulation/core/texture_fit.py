@@ -0,0 +1,93 @@
+"""
+Fitting of mesocrystal orientation distribution (texture) to experimental image.
+Ensemble image is linear in orientation weights, so weights are found by non-negative
+least squares on top of precomputed OrientationLibrary images.
+"""
+import numpy as np
+from scipy.optimize import nnls
+
+
+class TextureFit:
+    """
+    Finds non-negative weights of library orientations (and the scale of the base image)
+    reproducing experimental data on selected pixels.
+    Residuals are weighted by 1/sqrt(intensity) (Poisson statistics) when poisson=True,
+    regularization > 0 adds Tikhonov (ridge) term to prefer smooth, small weights.
+    """
+    def __init__(self, library, exp_array, mask=None, poisson=True, regularization=0.0):
+        self.m_library = library
+        self.m_exp_array = np.asarray(exp_array, dtype=float)
+        for name, array in (("experimental data", self.m_exp_array), ("mask", mask)):
+            if array is not None and np.shape(array) != library.m_roi_mask.shape:
+                raise ValueError("Shape of {} {} doesn't match library images {}".format(
+                    name, np.shape(array), library.m_roi_mask.shape))
+        self.m_mask = library.m_roi_mask if mask is None else (mask & library.m_roi_mask)
+        self.m_poisson = poisson
+        self.m_regularization = regularization
+        self.m_weights = None
+        self.m_base_weight = 0.0
+        self.m_residual = None
+
+    def design_matrix(self):
+        """
+        Returns matrix (n_pixels, n_nodes+1) of library images on masked pixels, last column is base image.
+        """
+        mask = self.m_mask.ravel()
+        nodes = self.m_library.node_matrix()[:, mask]
+        base = self.m_library.m_base_image.ravel()[mask]
+        return np.vstack([nodes, base[np.newaxis, :]]).T
+
+    def fit(self):
+        """
+        Solves for the weights, returns array of node weights of shape (nphi, ntilt).
+        """
+        matrix = self.design_matrix()
+        target = self.m_exp_array.ravel()[self.m_mask.ravel()] - self.m_library.m_background
+
+        if self.m_poisson:
+            sigma = np.sqrt(np.maximum(self.m_exp_array.ravel()[self.m_mask.ravel()], 1.0))
+            matrix = matrix/sigma[:, np.newaxis]
+            target = target/sigma
+
+        # columns are scaled to unit norm for better conditioning of the problem
+        norms = np.linalg.norm(matrix, axis=0)
+        norms[norms == 0.0] = 1.0
+        matrix = matrix/norms
+
+        if self.m_regularization > 0.0:
+            n = matrix.shape[1]
+            matrix = np.vstack([matrix, np.sqrt(self.m_regularization)*np.eye(n)])
+            target = np.concatenate([target, np.zeros(n)])
+
+        solution, self.m_residual = nnls(matrix, target)
+        solution /= norms
+
+        shape = self.m_library.m_images.shape[:2]
+        self.m_weights = solution[:-1].reshape(shape)
+        self.m_base_weight = solution[-1]
+        return self.m_weights
+
+    def fitted_image(self):
+        layout_weight = np.sum(self.m_weights)
+        weights = self.m_weights if layout_weight > 0.0 else np.ones_like(self.m_weights)
+        return self.m_library.pattern(weights, layout_weight, self.m_base_weight)
+
+    def orientations(self, threshold=1e-3):
+        """
+        Returns list of [phi, tilt, weight] of orientations with relative weight above the threshold,
+        weights are normalized to unit sum.
+        """
+        weights = self.m_weights/np.sum(self.m_weights)
+        result = []
+        for i_phi, phi in enumerate(self.m_library.m_phi_values):
+            for i_tilt, tilt in enumerate(self.m_library.m_tilt_values):
+                if weights[i_phi, i_tilt] > threshold:
+                    result.append([float(phi), float(tilt), float(weights[i_phi, i_tilt])])
+        return result
+
+    def factory_config(self, threshold=1e-3):
+        """
+        Returns settings to be put in RotatedMesoFactory section of the sample config.
+        """
+        return {"orientations": self.orientations(threshold),
+                "layout_weight": float(np.sum(self.m_weights))}
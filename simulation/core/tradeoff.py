@@ -0,0 +1,66 @@
+"""
+Accuracy versus cost of discretization knobs (phi_steps, nparticles, number of distribution
+points, meso_count, Monte Carlo points). Every setting of the knob is compared with the image
+simulated at high resolution reference setting.
+"""
+import numpy as np
+from .peak_analysis import PeakAnalysis
+from .metrics import relative_l2
+
+
+def pareto_front(points):
+    """
+    Returns indices of points (time, error) not dominated by any other point, sorted by time.
+    """
+    order = sorted(range(len(points)), key=lambda i: (points[i][0], points[i][1]))
+    result = []
+    best_error = np.inf
+    for index in order:
+        if points[index][1] < best_error:
+            result.append(index)
+            best_error = points[index][1]
+    return result
+
+
+class TradeoffAnalysis:
+    """
+    Collects (value, time, array) of one knob and computes errors against the reference array:
+    "l2" (relative L2 of the whole image) and "peak" (maximum relative error of background
+    subtracted intensities of reference peaks).
+    """
+    def __init__(self, name, detector_builder, reference_array, reference_time):
+        self.m_name = name
+        # reference and knob images are cropped to the region of interest of detector_builder
+        self.m_analysis = PeakAnalysis(detector_builder)
+        self.m_reference = np.asarray(reference_array, dtype=float)
+        self.m_reference_time = reference_time
+        self.m_reference_peaks = self.m_analysis.analyze(self.m_reference)["intensity"][0]
+        self.m_rows = []
+
+    def peak_error(self, array):
+        # peaks outside of region of interest have no reference intensity
+        valid = self.m_reference_peaks > 0.0
+        if not np.any(valid):
+            return 0.0
+        intensity = self.m_analysis.analyze(array)["intensity"][0][valid]
+        return float(np.max(np.abs(intensity/self.m_reference_peaks[valid] - 1.0)))
+
+    def add(self, value, time_spend, array):
+        self.m_rows.append({"knob": self.m_name, "value": value, "time": time_spend,
+                            "l2": relative_l2(array, self.m_reference), "peak": self.peak_error(array)})
+
+    def rows(self):
+        return self.m_rows
+
+    def front(self, error="l2"):
+        """
+        Returns rows of the Pareto front of time versus given error.
+        """
+        return [self.m_rows[i] for i in pareto_front([(row["time"], row[error]) for row in self.m_rows])]
+
+    def recommend(self, l2_budget, peak_budget):
+        """
+        Returns the cheapest row meeting both error budgets, None if no setting does.
+        """
+        rows = [row for row in self.m_rows if row["l2"] <= l2_budget and row["peak"] <= peak_budget]
+        return min(rows, key=lambda row: row["time"]) if rows else None
@@ -0,0 +1,52 @@
+"""
+Fits sample parameters to experimental data with Gaussian process surrogate model.
+Uses the same fit presets as run_fit.py. All simulated points are kept in output/bayesopt-store
+and, together with points of run_scan.py, reused by the following runs.
+"""
+import argparse
+import json
+import os
+from core.scan_executor import ScanExecutor
+from core.result_cache import ResultCache
+from core.scan_store import ScanStore
+from core.surrogate import BayesOptimizer
+from core.meso_utils import load_setup
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fit", default="lattice", help="fit preset from fit_config.json")
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="number of BornAgain threads per worker")
+    parser.add_argument("--batch", type=int, default=None, help="points per iteration (default: workers)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    fit_config = load_setup("fit_config.json", args.fit)
+    if args.batch:
+        fit_config["batch"] = args.batch
+
+    output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output"))
+    store = ScanStore(os.path.join(output, "bayesopt-store"))
+    executor = ScanExecutor(workers=args.workers, threads=args.threads, cache=ResultCache(), store=store)
+    optimizer = BayesOptimizer(exp_config, sample_config, fit_config, executor,
+                               [store, ScanStore(os.path.join(output, "scan-store"))])
+    value, parameters = optimizer.run()
+
+    print("Best objective {:.5f} of {} points".format(value, len(optimizer.m_y)))
+    for name, par_value in parameters.items():
+        print("{:36s} {:.5g}".format(name, par_value))
+
+    result_file = os.path.join(output, "bayesopt-{}-{}-result.json".format(args.fit, args.preset))
+    with open(result_file, "w") as f:
+        json.dump({"objective": value, "parameters": parameters, "trace": optimizer.m_trace}, f, indent=2)
+    print("Result is written to '{}'".format(result_file))
+
+
+if __name__ == '__main__':
+    main()
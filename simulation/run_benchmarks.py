@@ -0,0 +1,148 @@
+"""
+Benchmark suite over sample_config.json presets and their scaled variants.
+Every case is simulated on a small fixed detector in a fresh worker process, sample build time,
+simulation time, peak memory and particle count are compared against the stored baseline.
+"""
+from core.simulation_builder import SimulationBuilder
+from core.meso_utils import load_setup
+from core.fitting import set_config_value
+from concurrent.futures import ProcessPoolExecutor
+import numpy.random as npr
+import argparse
+import random
+import resource
+import json
+import time
+import os
+
+thresholds = {"build_time": 0.2, "simulation_time": 0.2, "peak_rss_mb": 0.1}
+
+
+def count_particles(node):
+    """
+    Returns number of particles and mesocrystals in the sample tree (basis particles included).
+    """
+    result = 1 if node.getName() in ("Particle", "MesoCrystal") else 0
+    for child in node.getChildren():
+        result += count_particles(child)
+    return result
+
+
+def case_configs(case, exp_overrides):
+    exp_config = load_setup("exp_config.json", case.get("exp_preset", "exp1"))
+    for key, value in dict(exp_overrides, **case.get("exp", {})).items():
+        set_config_value(exp_config, key, value)
+    sample_config = load_setup("sample_config.json", case["preset"])
+    for key, value in case.get("sample", {}).items():
+        set_config_value(sample_config, key, value)
+    return exp_config, sample_config
+
+
+def run_case(exp_config, sample_config, threads):
+    """
+    Runs single benchmark case, executed in fresh worker process to isolate peak memory.
+    """
+    npr.seed(0)
+    random.seed(0)
+    builder = SimulationBuilder(exp_config, sample_config, threads)
+    simulation = builder.create_simulation()
+    start = time.perf_counter()
+    sample = builder.m_sample_builder.build_sample(builder.m_beam_wavelength)
+    build_time = time.perf_counter() - start
+    simulation.setSample(sample)
+    start = time.perf_counter()
+    simulation.runSimulation()
+    simulation_time = time.perf_counter() - start
+    return {"build_time": build_time, "simulation_time": simulation_time,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0,
+            "particles": count_particles(sample)}
+
+
+def run_benchmarks(config, mode, threads=0, repeat=1):
+    results = dict()
+    for case in config[mode]:
+        exp_config, sample_config = case_configs(case, config.get("exp_config", {}))
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                runs.append(pool.submit(run_case, exp_config, sample_config, threads).result())
+        # minimum over repetitions is the least noisy estimate
+        result = {key: min(run[key] for run in runs) for key in thresholds}
+        result["particles"] = runs[0]["particles"]
+        results[case["name"]] = result
+        print("{:<28} build {:8.3f} s  simulation {:8.3f} s  peak {:8.1f} MB  particles {}".format(
+            case["name"], result["build_time"], result["simulation_time"], result["peak_rss_mb"],
+            result["particles"]))
+    return results
+
+
+def compare(results, baseline):
+    """
+    Returns list of messages about metrics exceeding baseline by more than the threshold.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key, threshold in thresholds.items():
+            reference = baseline[name][key]
+            if reference > 0.0 and result[key] > reference*(1.0 + threshold):
+                regressions.append("{}: {} {:.3f} > {:.3f} (+{:.0f}%)".format(
+                    name, key, result[key], reference, 100.0*(result[key]/reference - 1.0)))
+        if result["particles"] != baseline[name]["particles"]:
+            regressions.append("{}: particles {} != {}".format(name, result["particles"],
+                                                               baseline[name]["particles"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--full", action="store_true", help="run full suite instead of the quick one")
+    parser.add_argument("--threads", type=int, default=0, help="BornAgain threads (0 - all cores)")
+    parser.add_argument("--repeat", type=int, default=1, help="repetitions of every case (minimum is taken)")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="baseline json file")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the new baseline")
+    args = parser.parse_args()
+
+    with open("benchmark_config.json") as f:
+        config = json.load(f)
+    mode = "full" if args.full else "quick"
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    missing = [case["name"] for case in config[mode] if case["name"] not in baseline]
+    if not args.save_baseline:
+        if len(missing) == len(config[mode]):
+            # nothing to compare with, fail before spending time on the suite
+            print("ERROR: no baseline for {} cases in '{}', run on the reference version with "
+                  "--save-baseline first".format(mode, args.baseline))
+            raise SystemExit(2)
+        for name in missing:
+            print("WARNING: no baseline for case '{}', it is not checked".format(name))
+
+    results = run_benchmarks(config, mode, args.threads, args.repeat)
+
+    output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output"))
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, "benchmarks-{}.json".format(mode)), "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Baseline is written to '{}'".format(args.baseline))
+        return
+
+    regressions = compare(results, baseline)
+    for message in regressions:
+        print("REGRESSION " + message)
+    if regressions:
+        raise SystemExit(1)
+    print("No regressions against {} baseline cases".format(len([name for name in results if name in baseline])))
+
+
+if __name__ == '__main__':
+    main()
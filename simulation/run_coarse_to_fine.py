@@ -0,0 +1,48 @@
+"""
+Scans parameter on coarse (binned) detector and re-runs the best candidates at full resolution.
+"""
+import argparse
+import copy
+import numpy as np
+from core.scan_executor import ScanExecutor
+from core.result_cache import ResultCache
+from core.coarse_to_fine import CoarseToFine
+from core.meso_utils import load_setup
+
+
+def lattice_length_c_candidates(sample_config):
+    result = []
+    for value in np.linspace(29.0, 33.0, 20):
+        cfg = copy.deepcopy(sample_config)
+        cfg["lattice_length_c"] = value
+        result.append(cfg)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--binning", type=int, default=4, choices=[2, 4, 8], help="coarse binning factor")
+    parser.add_argument("--keep", type=int, default=3, help="number of candidates to re-run at full resolution")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="number of BornAgain threads per worker")
+    args = parser.parse_args()
+
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    candidates = lattice_length_c_candidates(sample_config)
+
+    executor = ScanExecutor(workers=args.workers, threads=args.threads, cache=ResultCache())
+    driver = CoarseToFine(executor, args.binning, args.keep)
+    best = driver.run(exp_config, candidates)
+
+    for index, metric in enumerate(driver.m_coarse_metrics):
+        print("candidate {:3d} lattice_length_c:{:6.2f} coarse log_chi2:{:.4f}".format(
+            index, candidates[index]["lattice_length_c"], metric))
+    for index, coarse_metric, fine_metric in best:
+        print("best {:3d} lattice_length_c:{:6.2f} coarse:{:.4f} fine:{:.4f}".format(
+            index, candidates[index]["lattice_length_c"], coarse_metric, fine_metric))
+
+
+if __name__ == '__main__':
+    main()
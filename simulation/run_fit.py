@@ -0,0 +1,68 @@
+"""
+Fits sample parameters to experimental data with differential evolution.
+Free parameters, bounds, objective and optimizer settings are taken from fit_config.json,
+candidates of every generation are simulated in parallel worker processes.
+"""
+import argparse
+import json
+import os
+from matplotlib import pyplot as plt
+from core.scan_executor import ScanExecutor
+from core.result_cache import ResultCache
+from core.fitting import Fitter
+from core.meso_utils import load_setup
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fit", default="lattice", help="fit preset from fit_config.json")
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="number of BornAgain threads per worker")
+    parser.add_argument("--no-cache", action="store_true", help="don't use results cached on disk")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    return parser.parse_args()
+
+
+def plot_trace(trace, filename):
+    generations = [entry["generation"] for entry in trace]
+    plt.figure(figsize=(6, 4))
+    plt.semilogy(generations, [entry["best"] for entry in trace], label="best")
+    plt.semilogy(generations, [entry["mean"] for entry in trace], label="mean")
+    plt.xlabel("generation")
+    plt.ylabel("objective")
+    plt.legend()
+    plt.savefig(filename)
+    plt.close()
+
+
+def main():
+    args = parse_args()
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    fit_config = load_setup("fit_config.json", args.fit)
+
+    # subdirectory is kept when ReportManager cleans the output directory
+    output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output/fits"))
+    os.makedirs(output, exist_ok=True)
+    checkpoint_file = os.path.join(output, "fit-{}-{}.json".format(args.fit, args.preset))
+
+    cache = None if args.no_cache else ResultCache()
+    executor = ScanExecutor(workers=args.workers, threads=args.threads, cache=cache)
+    fitter = Fitter(exp_config, sample_config, fit_config, executor, checkpoint_file)
+    value, parameters = fitter.run(args.resume)
+
+    print("Best objective {:.5f} after {} generations".format(value, fitter.m_generation))
+    for name, par_value in parameters.items():
+        print("{:36s} {:.5g}".format(name, par_value))
+
+    result_file = os.path.join(output, "fit-{}-{}-result.json".format(args.fit, args.preset))
+    with open(result_file, "w") as f:
+        json.dump({"objective": value, "parameters": parameters, "sample_config": fitter.best_config()},
+                  f, indent=2)
+    plot_trace(fitter.m_trace, os.path.join(output, "fit-{}-{}-trace.png".format(args.fit, args.preset)))
+    print("Result is written to '{}'".format(result_file))
+
+
+if __name__ == '__main__':
+    main()
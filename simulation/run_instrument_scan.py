@@ -0,0 +1,68 @@
+"""
+Scans instrument parameters (detector resolution, background, beam intensity) on top of
+single raw simulation. Raw pattern is simulated once (and cached), every scan point is
+then a cheap post-processing step.
+"""
+import argparse
+import itertools
+import time
+import numpy as np
+from matplotlib import pyplot as plt
+from core.simulation_builder import SimulationBuilder
+from core.result_cache import ResultCache
+from core.metrics import log_chi2
+from core.meso_utils import load_setup
+from run_simulation import plot_alongy
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--sigma", type=float, nargs=3, default=[0.5, 3.0, 11],
+                        metavar=("MIN", "MAX", "N"), help="range of det_sigma_factor")
+    parser.add_argument("--background", type=float, nargs=3, default=[100.0, 300.0, 9],
+                        metavar=("MIN", "MAX", "N"), help="range of constant background")
+    parser.add_argument("--intensity", type=float, nargs=3, default=[0.5, 2.0, 16],
+                        metavar=("MIN", "MAX", "N"),
+                        help="range of beam intensity relative to exp_config (log spaced)")
+    parser.add_argument("--threads", type=int, default=0, help="number of BornAgain threads")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+
+    builder = SimulationBuilder(exp_config, sample_config, args.threads, ResultCache())
+    raw_array = builder.raw_array()
+    exp_array = builder.experimentalData().array()
+    model = builder.m_instrument_model
+
+    sigmas = np.linspace(args.sigma[0], args.sigma[1], int(args.sigma[2]))
+    backgrounds = np.linspace(args.background[0], args.background[1], int(args.background[2]))
+    intensities = exp_config["beam_intensity"]*np.geomspace(args.intensity[0], args.intensity[1],
+                                                            int(args.intensity[2]))
+
+    start = time.time()
+    best = None
+    for sigma, background, intensity in itertools.product(sigmas, backgrounds, intensities):
+        model.set_parameters(intensity, background, sigma)
+        chi2 = log_chi2(model.apply(raw_array), exp_array)
+        if best is None or chi2 < best[0]:
+            best = (chi2, sigma, background, intensity)
+    npoints = len(sigmas)*len(backgrounds)*len(intensities)
+    elapsed = time.time() - start
+    print("{} points in {:.2f} sec ({:.1f} ms per point)".format(npoints, elapsed, 1e3*elapsed/npoints))
+
+    chi2, sigma, background, intensity = best
+    print("Best log_chi2 {:.4f}: det_sigma_factor:{:.3f} background:{:.1f} beam_intensity:{:.3e}".format(
+        chi2, sigma, background, intensity))
+
+    model.set_parameters(intensity, background, sigma)
+    plot_alongy(builder.experimentalData(), builder.convert_data(model.apply(raw_array)))
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Builds library of single mesocrystal orientation images and synthesizes ensemble
+patterns from it as weighted sums, without running BornAgain.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from matplotlib import pyplot as plt
+from core.simulation_builder import SimulationBuilder
+from core.scan_executor import ScanExecutor
+from core.result_cache import ResultCache
+from core.orientation_library import OrientationLibrary
+from core.create_mesocrystal_builder import create_mesocrystal_builder
+from core.mesocrystal_factory import RotatedMesoFactory
+from core.meso_utils import load_setup
+from run_simulation import plot_alongy
+
+library_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "libraries"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--phi-step", type=float, default=1.0, help="phi step of the library grid (deg)")
+    parser.add_argument("--tilt", type=float, nargs="+", default=[0.0], help="tilt values of the library grid (deg)")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="number of BornAgain threads per worker")
+    parser.add_argument("--rebuild", action="store_true", help="simulate library even if it exists")
+    return parser.parse_args()
+
+
+def get_library(exp_config, sample_config, args):
+    filename = os.path.join(library_dir, "library-{}.npz".format(args.preset))
+    if os.path.exists(filename) and not args.rebuild:
+        print("Loading library '{}'".format(filename))
+        return OrientationLibrary.load(filename)
+
+    phi_period = create_mesocrystal_builder(sample_config, None).phi_period()
+    phi_values = np.arange(0.0, phi_period, args.phi_step)
+    print("Building library: {} phi x {} tilt nodes".format(len(phi_values), len(args.tilt)))
+    executor = ScanExecutor(workers=args.workers, threads=args.threads, cache=ResultCache())
+    library = OrientationLibrary.build(exp_config, sample_config, phi_values, args.tilt, executor, phi_period)
+    os.makedirs(library_dir, exist_ok=True)
+    library.save(filename)
+    return library
+
+
+def main():
+    args = parse_args()
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    library = get_library(exp_config, sample_config, args)
+
+    factory = RotatedMesoFactory(sample_config)
+    start = time.time()
+    pattern = library.orientation_pattern(factory.orientations(), factory.m_layout_weight)
+    print("Ensemble pattern synthesized in {:.1f} msec".format((time.time()-start)*1e3))
+
+    builder = SimulationBuilder(exp_config, sample_config)
+    plot_alongy(builder.experimentalData(), builder.convert_data(pattern))
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
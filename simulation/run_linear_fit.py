@@ -0,0 +1,76 @@
+"""
+Simulates every particle layout of the sample separately and finds optimal beam intensity,
+layout weights and constant background in closed form (weighted least squares).
+With --meso-size the fit is repeated for growing mesocrystals, replacing hand tuned
+layout_weight of meso_size_scan in run_scan.py.
+"""
+import argparse
+import json
+import os
+from matplotlib import pyplot as plt
+from core.simulation_builder import SimulationBuilder
+from core.scan_executor import ScanExecutor
+from core.result_cache import ResultCache
+from core.linear_params import LinearFit, simulate_components
+from core.metrics import log_chi2
+from core.meso_utils import load_setup
+from run_simulation import plot_alongy
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--log-space", action="store_true", help="refine scales by minimizing log_chi2")
+    parser.add_argument("--no-poisson", action="store_true", help="don't weight residuals by 1/sqrt(I)")
+    parser.add_argument("--meso-size", type=float, nargs="+", default=None,
+                        help="factors of meso_height=50, meso_radius=100 to scan")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="number of BornAgain threads per worker")
+    return parser.parse_args()
+
+
+def fit_point(exp_config, sample_config, exp_array, executor, args):
+    names, components = simulate_components(exp_config, sample_config, executor)
+    linear_fit = LinearFit(names, components, exp_array, poisson=not args.no_poisson,
+                           log_space=args.log_space)
+    linear_fit.fit()
+    return linear_fit
+
+
+def main():
+    args = parse_args()
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    executor = ScanExecutor(workers=args.workers, threads=args.threads, cache=ResultCache())
+    builder = SimulationBuilder(exp_config, sample_config)
+    exp_array = builder.experimentalData().array()
+
+    if args.meso_size:
+        for factor in args.meso_size:
+            sample_config["meso_height"] = 50.0*factor
+            sample_config["meso_radius"] = 100.0*factor
+            linear_fit = fit_point(exp_config, sample_config, exp_array, executor, args)
+            print("meso_size factor:{:5.1f} log_chi2:{:.4f} scales:{} background:{:.1f}".format(
+                factor, log_chi2(linear_fit.model(), exp_array), linear_fit.m_scales, linear_fit.m_background))
+        return
+
+    linear_fit = fit_point(exp_config, sample_config, exp_array, executor, args)
+    for name, scale in zip(linear_fit.m_names, linear_fit.m_scales):
+        print("{:24s} scale:{:.4e}".format(name, scale))
+    print("background:{:.2f} log_chi2:{:.4f}".format(linear_fit.m_background,
+                                                     log_chi2(linear_fit.model(), exp_array)))
+
+    exp_cfg, sample_cfg = linear_fit.apply_to_configs(exp_config, sample_config)
+    output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output"))
+    os.makedirs(output, exist_ok=True)
+    filename = os.path.join(output, "linear-fit-{}.json".format(args.preset))
+    with open(filename, "w") as f:
+        json.dump({"exp_config": exp_cfg, "sample_config": sample_cfg}, f, indent=2)
+    print("Fitted configs are written to '{}'".format(filename))
+
+    plot_alongy(builder.experimentalData(), builder.convert_data(linear_fit.model()))
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
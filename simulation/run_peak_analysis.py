@@ -0,0 +1,44 @@
+"""
+Extracts peak centroids, widths and intensities of all points of the last scan
+(output/scan-store) and of the experimental data, writes them to output/peaks.csv.
+"""
+import argparse
+import os
+import numpy as np
+from core.simulation_builder import SimulationBuilder
+from core.scan_store import ScanStore
+from core.peak_analysis import PeakAnalysis
+from core.meso_utils import load_setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--store", default=None, help="scan store directory (default: output/scan-store)")
+    parser.add_argument("--peak-radius", type=float, default=None, help="radius of peak ellipses (mm)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output"))
+    store = ScanStore(args.store if args.store else os.path.join(output, "scan-store"))
+    records = [record for index, record in sorted(store.records().items())]
+
+    exp_config = records[0]["exp_config"] if records else load_setup("exp_config.json", "exp1")
+    sample_config = records[0]["sample_config"] if records else load_setup("sample_config.json", "rotmeso")
+    builder = SimulationBuilder(exp_config, sample_config)
+    analysis = PeakAnalysis(builder.m_detector_builder, args.peak_radius)
+
+    stack = [builder.experimentalData().array()] + [store.load_array(record) for record in records]
+    labels = ["exp"] + [record["index"] for record in records]
+    result = analysis.analyze(stack)
+
+    offsets = analysis.offsets(result)
+    for label, offset, intensity in zip(labels, offsets, result["intensity"]):
+        print("point {:>4}: mean offset {:.3f} mm, total peak intensity {:.4e}".format(
+            label, np.nanmean(offset), np.sum(intensity)))
+
+    filename = os.path.join(output, "peaks.csv")
+    analysis.write_table(filename, result, labels)
+    print("Peak table is written to '{}'".format(filename))
+
+
+if __name__ == '__main__':
+    main()
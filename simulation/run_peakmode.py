@@ -0,0 +1,61 @@
+"""
+Runs simulation in peak mode: only small windows around experimental peaks are simulated.
+Prints integrated intensities of every peak and the speedup with respect to the full ROI.
+"""
+import argparse
+import copy
+from core.simulation_builder import SimulationBuilder
+from core.detector_builder import DetectorBuilder
+from core.result_cache import ResultCache
+from core.meso_utils import load_setup
+
+
+def simulate(exp_config, sample_config, cache):
+    builder = SimulationBuilder(exp_config, sample_config, cache=cache)
+    result = builder.run_simulation()
+    return builder, result.array()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", default="rotmeso", help="sample preset from sample_config.json")
+    parser.add_argument("--peak-radius", type=float, default=None, help="radius of peak windows (mm)")
+    parser.add_argument("--compare", action="store_true", help="also run full ROI to measure the speedup")
+    parser.add_argument("--no-cache", action="store_true", help="always simulate")
+    args = parser.parse_args()
+
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    cache = None if args.no_cache or args.compare else ResultCache()
+
+    peak_config = copy.deepcopy(exp_config)
+    peak_config["peak_mode"] = True
+    if args.peak_radius:
+        peak_config["peak_radius"] = args.peak_radius
+
+    detector = DetectorBuilder(peak_config)
+    # pixels simulated in both modes, arrays of each mode are cropped to its own ROI
+    npix_full = detector.roi_mask(peak_mode=False).sum()
+    npix_peaks = detector.roi_mask(peak_mode=True).sum()
+    print("Pixels: full ROI {}, peak windows {} (of {} in bounding box), expected speedup {:.1f}".format(
+        npix_full, npix_peaks, detector.roi_shape(peak_mode=True)[0]*detector.roi_shape(peak_mode=True)[1],
+        npix_full/npix_peaks))
+
+    builder, peak_array = simulate(peak_config, sample_config, cache)
+    sim_peaks = detector.peak_intensities(peak_array, peak_mode=True)
+    exp_peaks = detector.peak_intensities(builder.experimentalData().array(), peak_mode=True)
+    for xp, yp, sim, exp in zip(detector.m_xpeaks, detector.m_ypeaks, sim_peaks, exp_peaks):
+        print("peak x:{:6.2f} y:{:6.2f}  sim:{:10.4e}  exp:{:10.4e}  ratio:{:6.3f}".format(
+            xp, yp, sim, exp, sim/exp if exp > 0 else 0.0))
+
+    if args.compare:
+        peak_time = builder.m_time_spend
+        full_builder, full_array = simulate(exp_config, sample_config, None)
+        full_peaks = detector.peak_intensities(full_array, peak_mode=False)
+        print("Measured speedup {:.1f}".format(full_builder.m_time_spend/peak_time))
+        print("Max relative deviation of peak intensities from full ROI: {:.3e}".format(
+            max(abs(p - f)/f for p, f in zip(sim_peaks, full_peaks) if f > 0)))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,21 @@
 Run consecutive simulations to scan sample parameter influence.
 """
 from core.report_manager import ReportManager
+from core.scan_executor import ScanExecutor
+from core.result_cache import ResultCache
+from core.scan_store import ScanStore
+from core.bragg_predictor import BraggPredictor
+from core.cost_model import CostModel
 from core.meso_utils import load_setup
+from core import instrumentation
 import numpy as np
-from run_simulation import run_single
+from run_simulation import report_single
+import argparse
 import os
 
 
-def scan_rotation_z(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Single meso, rotation_z"
+def scan_rotation_z(exp_config, sample_config, scan):
+    scan.set_title("Single meso, rotation_z")
     # values = np.linspace(-5.0, 5.0, 51)
     # values = np.linspace(17.7-5.0, 17.7+5.0, 51)
     # values = np.linspace(28.5-5.0, 28.5+5.0, 51)
@@ -17,54 +24,69 @@ def scan_rotation_z(exp_config, sample_config, report_manager):
     values = np.linspace(57.5-5.0, 57.5+5.0, 3)
     for value in values:
         sample_config["rotation_z"] = value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
 
 
-def scan_tilt(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Single meso, lattice_length_a"
+def scan_tilt(exp_config, sample_config, scan):
+    scan.set_title("Single meso, lattice_length_a")
     for value in np.linspace(-0.5, 0.5, 11):
         sample_config["rotation_x"] = value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
 
 
-def scan_lattice_length_a(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Single meso, lattice_length_a"
+def scan_lattice_length_a(exp_config, sample_config, scan):
+    scan.set_title("Single meso, lattice_length_a")
     for value in np.linspace(12.0, 13.0, 11):
         sample_config["lattice_length_a"] = value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
 
 
-def scan_lattice_length_c(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Single meso, lattice_length_a"
+def scan_lattice_length_c(exp_config, sample_config, scan):
+    scan.set_title("Single meso, lattice_length_a")
     for value in np.linspace(29.0, 33.0, 20):
         sample_config["lattice_length_c"] = value
-        run_single(exp_config, sample_config, report_manager)
-
-
-def scan_particle_pos_sigma(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Single meso, particle_pos_sigma"
+        scan.add_point(exp_config, sample_config)
+
+
+def scan_lattice_prescreened(exp_config, sample_config, scan, max_distance=0.5):
+    scan.set_title("Rotated meso, lattice_length_a and lattice_length_c")
+    predictor = BraggPredictor(exp_config)
+    values_a, values_c = np.meshgrid(np.linspace(12.0, 13.0, 11), np.linspace(29.0, 33.0, 11))
+    # Bragg peaks of the ensemble of mesocrystals rotated around Z
+    scores = predictor.score(values_a.ravel(), values_c.ravel(), np.linspace(0.0, 120.0, 241))
+    for value_a, value_c, score in zip(values_a.ravel(), values_c.ravel(), scores):
+        if score > max_distance:
+            continue
+        sample_config["lattice_length_a"] = value_a
+        sample_config["lattice_length_c"] = value_c
+        scan.add_point(exp_config, sample_config)
+    print("Bragg peak prescreening: {} of {} points accepted".format(np.sum(scores <= max_distance), len(scores)))
+
+
+def scan_particle_pos_sigma(exp_config, sample_config, scan):
+    scan.set_title("Single meso, particle_pos_sigma")
     for value in np.linspace(0.0, 2.0, 21):
         sample_config["particle_pos_sigma"] = value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
 
 
-def scan_meso_count(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Random meso, scan on meso_count. Stability of rndm()."
+def scan_meso_count(exp_config, sample_config, scan):
+    scan.set_title("Random meso, scan on meso_count. Stability of rndm().")
     values = [100, 100, 200, 200, 500, 500, 1000, 1000]
     for value in values:
         sample_config["RandomMesoFactory"]["meso_count"] = value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config, use_cache=False)
 
 
-def scan_tilt_span(exp_config, sample_config, report_manager):
-    report_manager.m_title = "RandomMeso, tilt_dtheta random span"
+def scan_tilt_span(exp_config, sample_config, scan):
+    scan.set_title("RandomMeso, tilt_dtheta random span")
     for value in np.linspace(0.0, 5.0, 11):
         sample_config["RandomMesoFactory"]["tilt_dtheta"] = value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
 
 
-def meso_size_scan(exp_config, sample_config, report_manager):
-    report_manager.m_title = "RandomMeso, growing meso"
+def meso_size_scan(exp_config, sample_config, scan):
+    scan.set_title("RandomMeso, growing meso")
     height0, radius0 = 50.0, 100.0
     factor = (1, 2, 4, 6, 10, 20)
     for value in factor:
@@ -75,45 +97,84 @@ def meso_size_scan(exp_config, sample_config, report_manager):
         sample_config["meso_height"] = height
         sample_config["meso_radius"] = radius
         sample_config["RandomMesoFactory"]["layout_weight"] = 2e-2*2/value
-        run_single(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
 
 
-def scan_roughness(exp_config, sample_config, report_manager):
-    report_manager.m_title = "RandomMeso, roughness scan"
+def scan_roughness(exp_config, sample_config, scan):
+    scan.set_title("RandomMeso, roughness scan")
     values = [0.5, 1.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 16.0, 20.0]
     for value in values:
         sample_config["roughness"] = value
-        run_single(exp_config, sample_config, report_manager)
-
-
-def single_shot(exp_config, sample_config, report_manager):
-    report_manager.m_title = "Rotated meso factory"
-    run_single(exp_config, sample_config, report_manager)
-
-
-def run_scan(exp_config, sample_config, report_manager):
-    # scan_rotation_z(exp_config, sample_config, report_manager)
-    # scan_tilt(exp_config, sample_config, report_manager)
-    # scan_lattice_length_a(exp_config, sample_config, report_manager)
-    # scan_lattice_length_c(exp_config, sample_config, report_manager)
-    # scan_particle_pos_sigma(exp_config, sample_config, report_manager)
-    # scan_meso_count(exp_config, sample_config, report_manager)
-    # scan_tilt_span(exp_config, sample_config, report_manager)
-    # meso_size_scan(exp_config, sample_config, report_manager)
-    # scan_roughness(exp_config, sample_config, report_manager)
-    single_shot(exp_config, sample_config, report_manager)
+        scan.add_point(exp_config, sample_config)
+
+
+def single_shot(exp_config, sample_config, scan):
+    scan.set_title("Rotated meso factory")
+    scan.add_point(exp_config, sample_config)
+
+
+def run_scan(exp_config, sample_config, scan):
+    # scan_rotation_z(exp_config, sample_config, scan)
+    # scan_tilt(exp_config, sample_config, scan)
+    # scan_lattice_length_a(exp_config, sample_config, scan)
+    # scan_lattice_length_c(exp_config, sample_config, scan)
+    # scan_lattice_prescreened(exp_config, sample_config, scan)
+    # scan_particle_pos_sigma(exp_config, sample_config, scan)
+    # scan_meso_count(exp_config, sample_config, scan)
+    # scan_tilt_span(exp_config, sample_config, scan)
+    # meso_size_scan(exp_config, sample_config, scan)
+    # scan_roughness(exp_config, sample_config, scan)
+    single_shot(exp_config, sample_config, scan)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs parameter scan and generates pdf report.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes running scan points in parallel")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="number of BornAgain threads per worker (0 - all cores)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always simulate, don't use results cached on disk")
+    parser.add_argument("--cache-size", type=float, default=2.0,
+                        help="maximum size of the result cache in GB")
+    parser.add_argument("--png-workers", type=int, default=2,
+                        help="number of background threads writing report images (0 - write immediately)")
+    parser.add_argument("--timings", action="store_true",
+                        help="write timing and memory of pipeline stages to output/timings.jsonl")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip points already stored by previous (interrupted) run of the same scan")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output"))
-    report_manager = ReportManager(output)
+    report_manager = ReportManager(output, png_workers=args.png_workers)
+    timings_file = os.path.join(output, "timings.jsonl")
+    if args.timings:
+        # enabled after ReportManager has cleaned the output directory
+        instrumentation.enable(timings_file)
+    cache = None if args.no_cache else ResultCache(max_size=int(args.cache_size*1024**3))
+    store = ScanStore(os.path.join(output, "scan-store"))
+    # runtimes recorded by previous scans calibrate the cost model before the store is cleared
+    cost_model = CostModel()
+    print("Cost model is calibrated on {} recorded runs".format(cost_model.calibrate_from_stores(
+        [store, ScanStore(os.path.join(output, "bayesopt-store"))])))
+    if not args.resume:
+        store.clear()
+    scan = ScanExecutor(report_manager, workers=args.workers, threads=args.threads, cache=cache,
+                        store=store, resume=args.resume, cost_model=cost_model)
 
     exp_config = load_setup("exp_config.json", "exp1")
     sample_config = load_setup("sample_config.json", "rotmeso")
 
-    run_scan(exp_config, sample_config, report_manager)
+    run_scan(exp_config, sample_config, scan)
+    scan.run(report_single)
 
     report_manager.generate_pdf()
+    if args.timings:
+        for stage, (count, wall, cpu, rss) in sorted(instrumentation.summary(timings_file).items()):
+            print("{:48s} n:{:4d} wall:{:9.2f} s cpu:{:9.2f} s peak rss:{:8.1f} MB".format(stage, count, wall, cpu, rss))
     print("Terminated successfully")
 
 
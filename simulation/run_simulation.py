@@ -2,6 +2,10 @@ import bornagain as ba
 from matplotlib import pyplot as plt
 from core.simulation_builder import SimulationBuilder
 from core.meso_utils import load_setup
+from core.result_cache import ResultCache
+from core.result_slicer import slicer
+from core.figure_template import AlongYTemplate
+from core import instrumentation
 import json
 import matplotlib.gridspec as gridspec
 
@@ -17,10 +21,10 @@ def plot_colormap(data, zmin=1e+03, zmax=1e+07, units=ba.AxesUnits.MM, zlabel=""
     ba.plot_colormap(data, zmin=zmin, zmax=zmax, units=units, zlabel=zlabel, cmap=cmap, aspect=aspect)
 
 
-def plot_vertical_slices(data, xpeaks):
+def plot_vertical_slices(data, xpeaks, units=ba.AxesUnits.MM):
+    ymin, ymax = slicer(data, units).y_range()
     for x in xpeaks:
-        plt.plot([x, x], [data.histogram2d().getYmin(), data.histogram2d().getYmax()],
-             color='gray', linestyle='-', linewidth=1)
+        plt.plot([x, x], [ymin, ymax], color='gray', linestyle='-', linewidth=1)
 
 
 def plot_alongx(exp_data, sim_result, units=ba.AxesUnits.MM):
@@ -37,11 +41,11 @@ def plot_alongx(exp_data, sim_result, units=ba.AxesUnits.MM):
     gs2 = gridspec.GridSpec(1, 1)
     gs2.update(left=0.05, right=0.95, bottom=0.05, top=0.455, wspace=0.05)
     ax = plt.subplot(gs2[0])
-    exp_proj = exp_data.histogram2d(units).projectionX()
-    plt.semilogy(exp_proj.getBinCenters(), exp_proj.getBinValues()+1, label=r'$\phi=0.0^{\circ}$')
+    centers, values = slicer(exp_data, units).projection_x()
+    plt.semilogy(centers, values+1, label=r'$\phi=0.0^{\circ}$')
 
-    sim_proj = sim_result.histogram2d(units).projectionX()
-    plt.semilogy(sim_proj.getBinCenters(), sim_proj.getBinValues()+1, label=r'$\phi=0.0^{\circ}$')
+    centers, values = slicer(sim_result, units).projection_x()
+    plt.semilogy(centers, values+1, label=r'$\phi=0.0^{\circ}$')
 
     plt.ylim(1e+03, 1e+09)
 
@@ -58,24 +62,23 @@ def plot_alongy(exp_data, sim_result, units=ba.AxesUnits.MM):
 
     plt.subplot(gs1[0])
     plot_colormap(exp_data)
-    plot_vertical_slices(exp_data, xpeaks)
+    plot_vertical_slices(exp_data, xpeaks, units)
 
     plt.subplot(gs1[1])
     plot_colormap(sim_result)
-    plot_vertical_slices(sim_result, xpeaks)
+    plot_vertical_slices(sim_result, xpeaks, units)
 
     gs2 = gridspec.GridSpec(2, 3)
     gs2.update(left=0.05, right=0.95, bottom=0.05, top=0.455, wspace=0.1)
 
+    xmins = [x - 0.25 for x in xpeaks]
+    xmaxs = [x + 0.25 for x in xpeaks]
+    exp_centers, exp_projections = slicer(exp_data, units).projections_y(xmins, xmaxs)
+    sim_centers, sim_projections = slicer(sim_result, units).projections_y(xmins, xmaxs)
     for index, x in enumerate(xpeaks):
         ax = plt.subplot(gs2[index])
-        xmin = x - 0.25
-        xmax = x + 0.25
-        exp_proj = exp_data.histogram2d(units).projectionY(xmin, xmax)
-        plt.semilogy(exp_proj.getBinCenters(), exp_proj.getBinValues()+1, label=r'$\phi=0.0^{\circ}$')
-
-        sim_proj = sim_result.histogram2d(units).projectionY(xmin, xmax)
-        plt.semilogy(sim_proj.getBinCenters(), sim_proj.getBinValues()+1, label=r'$\phi=0.0^{\circ}$')
+        plt.semilogy(exp_centers, exp_projections[index]+1, label=r'$\phi=0.0^{\circ}$')
+        plt.semilogy(sim_centers, sim_projections[index]+1, label=r'$\phi=0.0^{\circ}$')
         plt.ylim(1e+03, 1e+07)
 
     return fig
@@ -86,29 +89,37 @@ def write_real_data_to_report(builder, report):
     report.write_report(slide_title="004_230_P144_im_full")
 
 
-def run_single(exp_config, sample_config, report=None):
-    builder = SimulationBuilder(exp_config, sample_config)
+def run_single(exp_config, sample_config, report=None, cache=None):
+    builder = SimulationBuilder(exp_config, sample_config, cache=cache)
     print(json.dumps(sample_config, sort_keys=True, indent=2, separators=(',', ': ')))
     result = builder.run_simulation()
+    report_single(builder, result, sample_config, report)
+
+
+def report_single(builder, result, sample_config, report=None):
+    """
+    Plots simulation result against experimental data and writes it to the report.
+    """
+    if report:
+        # figure layout is created once per report, only data are updated for every point
+        template = report.figure_template("alongy", AlongYTemplate)
+        with instrumentation.span("plot"):
+            template.update(builder.experimentalData(), result)
+        report.write_report(sample_config, figure=template)
+        return
+
     figs = []
     # figs.append(plot_simulation(result))
     # figs.append(plot_alongx(builder.experimentalData(), result))
     figs.append(plot_alongy(builder.experimentalData(), result))
-
-    if report:
-        report.write_report(sample_config)
-        for fig in figs:
-            #report.add_page(json_config=config, mfig=figs)
-            plt.close(fig)
-    else:
-        plt.show()
+    plt.show()
 
 
 def main():
     exp_config = load_setup("exp_config.json", "exp1")
     sample_config = load_setup("sample_config.json", "randommeso")
 
-    run_single(exp_config, sample_config)
+    run_single(exp_config, sample_config, cache=ResultCache())
     print("Terminated successfully")
 
 
@@ -6,6 +6,7 @@ from bornagain import deg, nm, angstrom
 import math
 import periodictable as pt
 import numpy as np
+from core.distributions import lognormal_nodes, gaussian_nodes, weighted_formfactor, add_particle_distribution
 
 m_pixel_size = 4 * 41.74e-3  # mm
 
@@ -17,7 +18,7 @@ class MesoCrystalBuilder:
     def __init__(self, particle_material):
         self.m_lattice_length_a = 12.5*nm
         self.m_lattice_length_c = 31.1*nm
-        self.m_nparticles = 10
+        self.m_nparticles = 7  # Gauss-Hermite nodes of radius distribution
         self.m_nanoparticle_radius = 5.02*nm
         self.m_sigma_nanoparticle_radius = 0.3*nm
         self.m_meso_height = 300*nm
@@ -36,7 +37,8 @@ class MesoCrystalBuilder:
 
     def create_basis(self, material, lattice, np_radius, np_sigma_radius, nparticles):
         scale_param = math.sqrt(math.log((np_sigma_radius/np_radius)**2 + 1.0))
-        particle = ba.Particle(material, ba.FormFactorSphereLogNormalRadius(np_radius, scale_param, nparticles))
+        radii, weights = lognormal_nodes(np_radius, scale_param, nparticles)
+        particle = ba.Particle(material, weighted_formfactor(ba.FormFactorFullSphere, radii, weights))
 
         bas_a = lattice.getBasisVectorA()
         bas_b = lattice.getBasisVectorB()
@@ -143,22 +145,17 @@ def create_diffuse_layout(particle_material, average_layer_thickness):
     """
 
     m_radius = 5.02
-    m_nparticles = 100
+    m_nparticles = 9  # Gauss-Hermite nodes
     m_sigma = 0.5
     m_diffuse_surface_density = 1e-2
 
     layout = ba.ParticleLayout()
 
-    distr = ba.DistributionGaussian(m_radius, m_sigma)
+    radii, weights = gaussian_nodes(m_radius, m_sigma, m_nparticles)
     # scale_param = math.sqrt(math.log((m_sigma / m_radius) ** 2 + 1.0))
-    # distr = ba.DistributionLogNormal(m_radius, scale_param)
-    particle = ba.Particle(particle_material, ba.FormFactorFullSphere(m_radius))
-
-    sigma_factor = 3.0
-    par_distr = ba.ParameterDistribution(
-        "/Particle/FullSphere/Radius", distr, m_nparticles, sigma_factor)
-    part_coll = ba.ParticleDistribution(particle, par_distr)
-    layout.addParticle(part_coll, 1.0, ba.kvector_t(0, 0, -average_layer_thickness+10))
+    # radii, weights = lognormal_nodes(m_radius, scale_param, m_nparticles)
+    add_particle_distribution(layout, lambda r: ba.Particle(particle_material, ba.FormFactorFullSphere(r)),
+                              radii, weights, 1.0, ba.kvector_t(0, 0, -average_layer_thickness+10))
 
     layout.setTotalParticleSurfaceDensity(m_diffuse_surface_density)
 
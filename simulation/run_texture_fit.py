@@ -0,0 +1,63 @@
+"""
+Fits orientation distribution of mesocrystals to experimental image using precomputed
+orientation library (see run_library.py) and non-negative least squares.
+"""
+import argparse
+import json
+import os
+import time
+from matplotlib import pyplot as plt
+from core.simulation_builder import SimulationBuilder
+from core.orientation_library import OrientationLibrary
+from core.texture_fit import TextureFit
+from core.metrics import log_chi2
+from core.meso_utils import load_setup
+from run_simulation import plot_alongy
+from run_library import library_dir
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", default="rotmeso", help="sample preset the library was built for")
+    parser.add_argument("--mask", choices=["roi", "peaks"], default="roi",
+                        help="fit all simulated pixels or only pixels around experimental peaks")
+    parser.add_argument("--peak-radius", type=float, default=None, help="radius of peak ellipses (mm)")
+    parser.add_argument("--regularization", type=float, default=0.0, help="weight of Tikhonov term")
+    parser.add_argument("--no-poisson", action="store_true", help="don't weight residuals by 1/sqrt(I)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    exp_config = load_setup("exp_config.json", "exp1")
+    sample_config = load_setup("sample_config.json", args.preset)
+    library = OrientationLibrary.load(os.path.join(library_dir, "library-{}.npz".format(args.preset)))
+
+    builder = SimulationBuilder(exp_config, sample_config)
+    exp_array = builder.experimentalData().array()
+    # mask in the geometry of ROI-cropped arrays, same as library images
+    mask = builder.m_detector_builder.peak_mask(args.peak_radius) if args.mask == "peaks" else None
+
+    start = time.time()
+    texture_fit = TextureFit(library, exp_array, mask, not args.no_poisson, args.regularization)
+    texture_fit.fit()
+    fitted = texture_fit.fitted_image()
+    print("Fit done in {:.2f} sec, log_chi2 {:.4f}".format(time.time()-start, log_chi2(fitted, exp_array)))
+
+    settings = texture_fit.factory_config()
+    for phi, tilt, weight in settings["orientations"]:
+        print("phi:{:7.2f} tilt:{:6.2f} weight:{:.4f}".format(phi, tilt, weight))
+    print("layout_weight: {:.4e}, base image scale {:.3f}".format(settings["layout_weight"],
+                                                                 texture_fit.m_base_weight))
+
+    filename = os.path.join(library_dir, "texture-{}.json".format(args.preset))
+    with open(filename, "w") as f:
+        json.dump(settings, f, indent=2)
+    print("Orientations for RotatedMesoFactory are written to '{}'".format(filename))
+
+    plot_alongy(builder.experimentalData(), builder.convert_data(fitted))
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Accuracy versus cost of discretization knobs.
+Every knob of benchmark_config.json "tradeoff" is swept, images are compared with the high
+resolution reference (relative L2, per-peak intensity error) and simulation times are measured.
+Pareto front and the cheapest setting meeting the error budget are printed for every knob.
+"""
+from core.simulation_builder import SimulationBuilder
+from core.tradeoff import TradeoffAnalysis
+from run_benchmarks import case_configs
+import numpy.random as npr
+import argparse
+import random
+import json
+import time
+import os
+
+
+def set_knob(config, key, value):
+    names = key.split(".")
+    for name in names[:-1]:
+        config = config.setdefault(name, dict())
+    config[names[-1]] = value
+
+
+def simulate(exp_config, sample_config, threads):
+    """
+    Returns intensity array and time of sample building plus simulation.
+    """
+    npr.seed(0)
+    random.seed(0)
+    start = time.perf_counter()
+    builder = SimulationBuilder(exp_config, sample_config, threads)
+    array = builder.run_simulation().array()
+    return array, time.perf_counter() - start
+
+
+def sweep(name, knob, exp_overrides, threads):
+    exp_config, sample_config = case_configs(knob, exp_overrides)
+    target = exp_config if knob.get("target", "sample") == "exp" else sample_config
+
+    print("{}: reference {}".format(name, knob["reference"]))
+    set_knob(target, knob["key"], knob["reference"])
+    array, time_spend = simulate(exp_config, sample_config, threads)
+    analysis = TradeoffAnalysis(name, SimulationBuilder(exp_config, sample_config).m_detector_builder,
+                                array, time_spend)
+    for value in knob["values"]:
+        set_knob(target, knob["key"], value)
+        array, time_spend = simulate(exp_config, sample_config, threads)
+        analysis.add(value, time_spend, array)
+    return analysis
+
+
+def print_analysis(analysis, l2_budget, peak_budget):
+    front = analysis.front()
+    print("\n{} (reference {:.2f} s)".format(analysis.m_name, analysis.m_reference_time))
+    print("{:>10} {:>10} {:>10} {:>10}  pareto".format("value", "time", "l2", "peak"))
+    for row in analysis.rows():
+        print("{:>10} {:>10.3f} {:>10.4f} {:>10.4f}  {}".format(
+            row["value"], row["time"], row["l2"], row["peak"], "*" if row in front else ""))
+    best = analysis.recommend(l2_budget, peak_budget)
+    if best is None:
+        print("No setting meets the budget, use the reference value or extend the sweep")
+    else:
+        print("Recommended {} = {} ({:.3f} s, {:.1f}x faster than reference)".format(
+            analysis.m_name, best["value"], best["time"], analysis.m_reference_time/max(best["time"], 1e-9)))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--knobs", nargs="*", default=None, help="knobs to sweep (default: all)")
+    parser.add_argument("--l2-budget", type=float, default=0.02, help="allowed relative L2 error of the image")
+    parser.add_argument("--peak-budget", type=float, default=0.05, help="allowed relative error of peak intensities")
+    parser.add_argument("--threads", type=int, default=0, help="BornAgain threads (0 - all cores)")
+    args = parser.parse_args()
+
+    with open("benchmark_config.json") as f:
+        config = json.load(f)
+    knobs = config["tradeoff"]
+    names = args.knobs if args.knobs else list(knobs)
+
+    rows, recommendations = [], dict()
+    for name in names:
+        analysis = sweep(name, knobs[name], config.get("exp_config", {}), args.threads)
+        best = print_analysis(analysis, args.l2_budget, args.peak_budget)
+        recommendations[name] = best["value"] if best else None
+        rows += analysis.rows()
+
+    output = os.path.abspath(os.path.join(os.path.split(__file__)[0], "../output"))
+    os.makedirs(output, exist_ok=True)
+    filename = os.path.join(output, "tradeoff.json")
+    with open(filename, "w") as f:
+        json.dump({"l2_budget": args.l2_budget, "peak_budget": args.peak_budget,
+                   "recommendations": recommendations, "rows": rows}, f, indent=2)
+    print("\nResults are written to '{}'".format(filename))
+
+
+if __name__ == '__main__':
+    main()